@@ -23,10 +23,17 @@ __version__ = "1.6.3"
 #===============================================================================
 
 import sqlite3
+import heapq
+import itertools
 import json
 import os
+import queue
+import threading
+import time
+import weakref
+from concurrent.futures import Future
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Iterable, Iterator, Optional
 
 #===============================================================================
 
@@ -35,7 +42,13 @@ import structlog
 #===============================================================================
 
 from .anatomical_types import *
+from .cache import KnowledgeCache, LFUCache, LRUCache, LFU_POLICY, LRU_POLICY, knowledge_cache
+from .stats import CACHE_TIER, NPO_TIER, SCICRUNCH_TIER, SQLITE_TIER, WRITE_TIER, KnowledgeStats
+from .encoding import Knowledge, LazyKnowledge, decode_knowledge, encode_knowledge
+from .encoding import knowledge_blob, knowledge_etag, knowledge_hash, knowledge_json
 from .apinatomy import CONNECTIVITY_ONTOLOGIES, APINATOMY_MODEL_PREFIX
+from .asyncstore import AsyncKnowledgeStore
+from .federated import FederatedKnowledgeStore
 # from .nposparql import NpoSparql, NPO_NLP_NEURONS
 from .npo import Npo
 from .scicrunch import SCICRUNCH_PRODUCTION, SCICRUNCH_STAGING
@@ -51,9 +64,24 @@ except:
 
 KNOWLEDGE_BASE = 'knowledgebase.db'
 
+# Maximum number of entities in a single ``in (...)`` query
+BATCH_QUERY_SIZE = 500
+
+# Bytes of an immutable knowledge base to memory map
+SERVING_MMAP_SIZE = 1 << 30
+
+# Seconds before SCKAN is again asked about an entity it didn't know
+UNKNOWN_ENTITY_TTL = 7*24*60*60
+
+# Maximum number of stale entities refreshed in a single transaction
+REFRESH_BATCH_SIZE = 100
+
+# Seconds between checks of whether another connection has changed the knowledge base
+GENERATION_CHECK_INTERVAL = 0.1
+
 #===============================================================================
 
-SCHEMA_VERSION = '1.4'
+SCHEMA_VERSION = '1.16'
 
 ## Have auto update to remove any ``-npo`` suffix on ``source`` column values.
 
@@ -69,11 +97,97 @@ SCHEMA_VERSION = '1.4'
 
 
 
+# Full text search of labels, with rows having the same ``rowid`` as
+# their ``knowledge`` row. The ``before insert`` trigger removes the
+# entry of any row that a ``replace into knowledge`` will delete.
+KNOWLEDGE_LABELS_SCHEMA = """
+    create virtual table knowledge_labels using fts5(label, long_label,
+                                                     tokenize='unicode61 remove_diacritics 2', prefix='2 3');
+    create trigger knowledge_labels_replace before insert on knowledge begin
+        delete from knowledge_labels where rowid in
+            (select rowid from knowledge where source is new.source and entity=new.entity);
+    end;
+    create trigger knowledge_labels_insert after insert on knowledge begin
+        insert into knowledge_labels (rowid, label, long_label) values (new.rowid, new.label, new.long_label);
+    end;
+    create trigger knowledge_labels_update after update of label, long_label on knowledge begin
+        delete from knowledge_labels where rowid=old.rowid;
+        insert into knowledge_labels (rowid, label, long_label) values (new.rowid, new.label, new.long_label);
+    end;
+    create trigger knowledge_labels_delete after delete on knowledge begin
+        delete from knowledge_labels where rowid=old.rowid;
+    end;
+"""
+
+# The anatomical terms, as either region or layer, of connectivity nodes
+# and the paths that use them. Triggers keep this in sync with the rows of
+# ``connectivity_nodes``, whose ``node`` is a JSON ``[term, [layers...]]``.
+CONNECTIVITY_TERMS_SCHEMA = """
+    create table connectivity_terms (term text, source text, path text, node text);
+    create unique index connectivity_terms_index on connectivity_terms(term, source, path, node);
+    create index connectivity_terms_path_index on connectivity_terms(path, source);
+    create trigger connectivity_terms_insert after insert on connectivity_nodes begin
+        insert or ignore into connectivity_terms (term, source, path, node)
+            select json_extract(new.node, '$[0]'), new.source, new.path, new.node
+            union
+            select value, new.source, new.path, new.node from json_each(new.node, '$[1]');
+    end;
+    create trigger connectivity_terms_delete after delete on connectivity_nodes begin
+        delete from connectivity_terms where path=old.path and source is old.source and node=old.node;
+    end;
+"""
+
+# Knowledge itself is held, without its source, in ``knowledge_blobs`` and is
+# referenced by the ``hash`` of ``knowledge`` rows, so that knowledge that is
+# unchanged between sources is only stored once. Triggers remove blobs that
+# are no longer referenced, with the ``before insert`` trigger handling rows
+# that a ``replace into knowledge`` will delete.
+KNOWLEDGE_BLOBS_SCHEMA = """
+    create table knowledge_blobs (hash text primary key, knowledge blob);
+    create index knowledge_hash_index on knowledge(hash);
+    create trigger knowledge_blobs_replace before insert on knowledge begin
+        delete from knowledge_blobs where hash in
+            (select r.hash from knowledge as r where r.source is new.source and r.entity=new.entity
+                and r.hash is not new.hash and not exists
+                    (select 1 from knowledge as o where o.hash=r.hash and o.rowid!=r.rowid));
+    end;
+    create trigger knowledge_blobs_delete after delete on knowledge
+        when not exists (select 1 from knowledge where hash=old.hash) begin
+        delete from knowledge_blobs where hash=old.hash;
+    end;
+"""
+
+# Each knowledge source has a row in ``knowledge_sources`` with the number of
+# entities it has knowledge of and when it was created, which triggers keep up
+# to date, along with its SCKAN ``provenance``, as JSON, and, for an overlay
+# source, its ``parent`` source.
+KNOWLEDGE_SOURCES_SCHEMA = """
+    create trigger knowledge_sources_insert before insert on knowledge when new.source is not null begin
+        -- A ``replace into knowledge`` overrides the conflict resolution of an
+        -- ``insert or ignore`` here, so a source's row is only added if missing
+        insert into knowledge_sources (source, entities, created)
+            select new.source, 0, (julianday('now') - 2440587.5)*86400.0
+                where not exists (select 1 from knowledge_sources where source=new.source);
+        update knowledge_sources set entities=entities+1 where source=new.source
+            and not exists (select 1 from knowledge where source=new.source and entity=new.entity);
+    end;
+    create trigger knowledge_sources_delete after delete on knowledge when old.source is not null begin
+        update knowledge_sources set entities=entities-1 where source=old.source;
+    end;
+"""
+
 KNOWLEDGE_SCHEMA = f"""
     create table metadata (name text primary key, value text);
 
-    create table knowledge (source text, entity text, knowledge text);
+    create table knowledge (source text, entity text,
+                            label text, type text, has_connectivity integer, long_label text,
+                            hash text, fetched_at number);
     create unique index knowledge_index on knowledge(source, entity);
+    create index knowledge_label_index on knowledge(source, label);
+    create index knowledge_type_index on knowledge(source, type);
+    create index knowledge_connectivity_index on knowledge(source, has_connectivity);
+    {KNOWLEDGE_LABELS_SCHEMA}
+    {KNOWLEDGE_BLOBS_SCHEMA}
 
     create table connectivity_models (model text primary key, version text);
 
@@ -82,10 +196,99 @@ KNOWLEDGE_SCHEMA = f"""
 
     create table connectivity_nodes (source text, node text, path text);
     create unique index connectivity_nodes_index on connectivity_nodes(source, node, path);
+    {CONNECTIVITY_TERMS_SCHEMA}
+    create index connectivity_terms_source_index on connectivity_terms(source, term);
+
+    create table unknown_entities (source text, entity text, checked number);
+    create unique index unknown_entities_index on unknown_entities(source, entity);
+
+    create table knowledge_sources (source text primary key, parent text,
+                                    entities integer default 0, created number, provenance text);
+    {KNOWLEDGE_SOURCES_SCHEMA}
 
     insert into metadata (name, value) values ('schema_version', '{SCHEMA_VERSION}');
+    insert into metadata (name, value) values ('generation', '0');
+"""
+
+# Entities in these namespaces are connectivity knowledge
+CONNECTIVITY_NAMESPACES = [APINATOMY_MODEL_PREFIX] + [f'{ontology}:' for ontology in CONNECTIVITY_ONTOLOGIES]
+
+# An overlay knowledge source inherits the knowledge of its parent source,
+# other than connectivity, for entities that it has no knowledge of itself.
+# Connectivity is paths, entities in connectivity namespaces, and the terms
+# used by the parent's paths, as these are all replaced when a source's
+# connectivity is cleaned. ``SOURCE_LINEAGE`` is a CTE of a source, given as
+# its ``?`` parameter, and the sources it overlays, nearest first. A row of
+# ``knowledge as k`` joined with ``lineage as l`` is visible in the lineage's
+# first source when the ``VISIBLE_KNOWLEDGE`` condition holds.
+SOURCE_LINEAGE = """
+    with recursive lineage(source, depth) as (
+        select ?, 0
+        union all
+        select s.parent, l.depth + 1 from knowledge_sources as s join lineage as l on s.source=l.source
+            where s.parent is not null)
 """
 
+INHERITED_KNOWLEDGE = f"""(k.has_connectivity=0
+        and {' and '.join(f"substr(k.entity, 1, {len(prefix)})!='{prefix}'" for prefix in CONNECTIVITY_NAMESPACES)}
+        and not exists (select 1 from connectivity_terms as t where t.source=k.source and t.term=k.entity))"""
+
+VISIBLE_KNOWLEDGE = f"""(l.depth=0 or ({INHERITED_KNOWLEDGE} and not exists
+        (select 1 from knowledge as shadow join lineage as nearer on shadow.source=nearer.source
+            where shadow.entity=k.entity and nearer.depth < l.depth)))"""
+
+# Columns of a ``knowledge`` row, other than ``source``, ``entity`` and
+# ``fetched_at``, in the order of values returned by ``knowledge_columns()``
+KNOWLEDGE_VALUE_COLUMNS = ['label', 'long_label', 'type', 'has_connectivity', 'hash']
+
+KNOWLEDGE_INSERT = (f"replace into knowledge (source, entity, {', '.join(KNOWLEDGE_VALUE_COLUMNS)}, fetched_at) "
+                    f"values ({', '.join((len(KNOWLEDGE_VALUE_COLUMNS) + 3)*'?')})")
+
+KNOWLEDGE_BLOB_INSERT = 'insert or ignore into knowledge_blobs (hash, knowledge) values (?, ?)'
+
+def knowledge_columns(knowledge: Knowledge) -> tuple[Optional[str], Optional[str], Optional[str], int, str]:
+#===========================================================================================================
+    return (knowledge.get('label'), knowledge.get('long-label'),
+            knowledge.get('type'), int('connectivity' in knowledge), knowledge_hash(knowledge))
+
+def compress_knowledge(db: sqlite3.Connection):
+#==============================================
+    rows = db.execute('select rowid, knowledge from knowledge').fetchall()
+    db.executemany('update knowledge set knowledge=? where rowid=?',
+                    ((encode_knowledge(decode_knowledge(row[1])), row[0]) for row in rows))
+
+def set_knowledge_columns(db: sqlite3.Connection):
+#=================================================
+    updates = []
+    for row in db.execute('select rowid, knowledge from knowledge').fetchall():
+        knowledge = decode_knowledge(row[1])
+        updates.append((knowledge.get('label'), knowledge.get('type'), int('connectivity' in knowledge), row[0]))
+    db.executemany('update knowledge set label=?, type=?, has_connectivity=? where rowid=?', updates)
+
+def set_long_label_column(db: sqlite3.Connection):
+#=================================================
+    # Updating ``long_label`` also indexes the row's labels for searching
+    rows = db.execute('select rowid, knowledge from knowledge').fetchall()
+    db.executemany('update knowledge set long_label=? where rowid=?',
+                    ((decode_knowledge(row[1]).get('long-label'), row[0]) for row in rows))
+
+def set_hash_column(db: sqlite3.Connection):
+#===========================================
+    rows = db.execute('select rowid, knowledge from knowledge').fetchall()
+    db.executemany('update knowledge set hash=? where rowid=?',
+                    ((knowledge_hash(decode_knowledge(row[1])), row[0]) for row in rows))
+
+def move_knowledge_to_blobs(db: sqlite3.Connection):
+#===================================================
+    blobs = {}
+    for row in db.execute('select knowledge from knowledge').fetchall():
+        (hash, blob) = knowledge_blob(decode_knowledge(row[0]))
+        blobs.setdefault(hash, blob)
+    db.executemany(KNOWLEDGE_BLOB_INSERT, blobs.items())
+    db.execute('alter table knowledge drop column knowledge')
+
+## An upgrade may have a third, Python, step which is run after its SQL.
+
 SCHEMA_UPGRADES = {
     None: ('1.1', """
         alter table connectivity_models add version text;
@@ -111,6 +314,72 @@ SCHEMA_UPGRADES = {
         drop table labels;
         drop table publications;
         replace into metadata (name, value) values ('schema_version', '1.4');
+    """),
+    '1.4': ('1.5', """
+        replace into metadata (name, value) values ('schema_version', '1.5');
+    """, compress_knowledge),
+    '1.5': ('1.6', """
+        alter table knowledge add label text;
+        alter table knowledge add type text;
+        alter table knowledge add has_connectivity integer;
+        create index knowledge_label_index on knowledge(source, label);
+        create index knowledge_type_index on knowledge(source, type);
+        create index knowledge_connectivity_index on knowledge(source, has_connectivity);
+        replace into metadata (name, value) values ('schema_version', '1.6');
+    """, set_knowledge_columns),
+    '1.6': ('1.7', f"""
+        alter table knowledge add long_label text;
+        {KNOWLEDGE_LABELS_SCHEMA}
+        replace into metadata (name, value) values ('schema_version', '1.7');
+    """, set_long_label_column),
+    '1.7': ('1.8', f"""
+        {CONNECTIVITY_TERMS_SCHEMA}
+        insert or ignore into connectivity_terms (term, source, path, node)
+            select json_extract(node, '$[0]'), source, path, node from connectivity_nodes
+            union
+            select j.value, c.source, c.path, c.node from connectivity_nodes as c, json_each(c.node, '$[1]') as j;
+        replace into metadata (name, value) values ('schema_version', '1.8');
+    """),
+    '1.8': ('1.9', """
+        create index connectivity_terms_source_index on connectivity_terms(source, term);
+        replace into metadata (name, value) values ('schema_version', '1.9');
+    """),
+    '1.9': ('1.10', """
+        create table unknown_entities (source text, entity text, checked number);
+        create unique index unknown_entities_index on unknown_entities(source, entity);
+        replace into metadata (name, value) values ('schema_version', '1.10');
+    """),
+    '1.10': ('1.11', """
+        alter table knowledge add hash text;
+        replace into metadata (name, value) values ('schema_version', '1.11');
+    """, set_hash_column),
+    '1.11': ('1.12', """
+        create table knowledge_sources (source text primary key, parent text);
+        replace into metadata (name, value) values ('schema_version', '1.12');
+    """),
+    '1.12': ('1.13', f"""
+        {KNOWLEDGE_BLOBS_SCHEMA}
+        replace into metadata (name, value) values ('schema_version', '1.13');
+    """, move_knowledge_to_blobs),
+    '1.13': ('1.14', """
+        alter table knowledge add fetched_at number;
+        replace into metadata (name, value) values ('schema_version', '1.14');
+    """),
+    '1.14': ('1.15', """
+        insert or ignore into metadata (name, value) values ('generation', '0');
+        replace into metadata (name, value) values ('schema_version', '1.15');
+    """),
+    '1.15': ('1.16', f"""
+        alter table knowledge_sources add entities integer default 0;
+        alter table knowledge_sources add created number;
+        alter table knowledge_sources add provenance text;
+        {KNOWLEDGE_SOURCES_SCHEMA}
+        insert or ignore into knowledge_sources (source) select distinct source from knowledge where source is not null;
+        update knowledge_sources set
+            entities=(select count(*) from knowledge as k where k.source=knowledge_sources.source),
+            created=coalesce((select min(k.fetched_at) from knowledge as k where k.source=knowledge_sources.source),
+                             (julianday('now') - 2440587.5)*86400.0);
+        replace into metadata (name, value) values ('schema_version', '1.16');
     """)
 }
 
@@ -121,6 +390,34 @@ def clean_knowledge_source(source: str) -> str:
         return source[:-4]
     return source
 
+def connectivity_nodes(knowledge: Knowledge) -> list[tuple[str, tuple[str, ...]]]:
+#=================================================================================
+    """
+    The distinct nodes of an entity's connectivity, in order of first use.
+    """
+    nodes = {}
+    for edge in knowledge.get('connectivity', []):
+        for node in edge:
+            nodes[(node[0], tuple(node[1]))] = None
+    return list(nodes)
+
+def connectivity_terms(knowledge: Knowledge) -> set[str]:
+#========================================================
+    """
+    The anatomical terms, both regions and layers, used by an entity's connectivity.
+    """
+    terms = set()
+    for node in connectivity_nodes(knowledge):
+        terms.update((node[0],) + node[1])
+    return terms
+
+def prefix_upper_bound(prefix: str) -> str:
+#==========================================
+    """
+    The least string greater than all strings starting with ``prefix``.
+    """
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
 #===============================================================================
 #===============================================================================
 
@@ -145,12 +442,34 @@ def clean_knowledge_source(source: str) -> str:
 ## {"entity":"ILX:0793877","label":"Intermediolateral nucleus of sixth lumbar segment"}
 
 
+class ReadConnection(object):
+    """
+    A thread's read connection, which is closed when the thread exits and
+    releases its thread-local data.
+    """
+    def __init__(self, db: sqlite3.Connection):
+        self.db = db
+
+    def __del__(self):
+        self.db.close()
+
+#===============================================================================
+
 class KnowledgeBase(object):
-    def __init__(self, store_directory, read_only=False, create=False, knowledge_base=KNOWLEDGE_BASE):
+    def __init__(self, store_directory, read_only=False, create=False, knowledge_base=KNOWLEDGE_BASE,
+                       concurrent=False, immutable=False, mmap_size=SERVING_MMAP_SIZE):
         logger = structlog.get_logger(logger_name)
         self.__logger = logger.bind(type='knowledge')
         self.__db = None
         self.__read_only = read_only
+        self.__concurrent = concurrent
+        if immutable and not read_only:
+            raise ValueError('An immutable knowledge base must be opened read only')
+        self.__immutable = immutable
+        self.__mmap_size = mmap_size
+        self.__write_lock = threading.RLock()
+        self.__thread_local = threading.local()
+        self.__readers: weakref.WeakSet[ReadConnection] = weakref.WeakSet()
         if store_directory is None:
             self.__db_name = None
         else:
@@ -174,6 +493,45 @@ class KnowledgeBase(object):
     #============================================
         return self.__db
 
+    @property
+    def read_db(self) -> Optional[sqlite3.Connection]:
+    #=================================================
+        """
+        A connection for reading from the knowledge base.
+
+        Each thread has its own read-only connection, which is closed when the
+        thread exits. These connections don't hold a transaction open between
+        reads, so see changes made by other connections. An immutable knowledge
+        base that isn't concurrent is read using :attr:`db`.
+        """
+        if (self.__db is None or self.__db_name is None
+        or (self.__immutable and not self.__concurrent)):
+            return self.__db
+        if (reader := getattr(self.__thread_local, 'reader', None)) is None:
+            reader = ReadConnection(self.__connect(True, autocommit=True, check_same_thread=False))
+            self.__thread_local.reader = reader
+            with self.__write_lock:
+                self.__readers.add(reader)
+        return reader.db
+
+    @property
+    def concurrent(self) -> bool:
+    #============================
+        return self.__concurrent
+
+    @property
+    def immutable(self) -> bool:
+    #===========================
+        return self.__immutable
+
+    @property
+    def write_lock(self) -> threading.RLock:
+    #=======================================
+        """
+        Held while using :attr:`db`, so that there is only ever a single writer.
+        """
+        return self.__write_lock
+
     @property
     def log(self) -> structlog.BoundLogger:
     #======================================
@@ -191,18 +549,52 @@ class KnowledgeBase(object):
 
     def close(self):
     #===============
-        if self.__db is not None:
-            self.__db.close()
-            self.__db = None
+        with self.__write_lock:
+            for reader in list(self.__readers):
+                reader.db.close()
+            self.__readers = weakref.WeakSet()
+            self.__thread_local = threading.local()
+            if self.__db is not None:
+                self.__db.close()
+                self.__db = None
+
+    def __connect(self, read_only: bool, autocommit: bool, check_same_thread: bool) -> sqlite3.Connection:
+    #=====================================================================================================
+        assert self.__db_name is not None
+        if self.__immutable:
+            # SQLite doesn't lock, nor check for changes to, an immutable database
+            db_uri = f'{self.__db_name.as_uri()}?mode=ro&immutable=1'
+        elif read_only:
+            db_uri = f'{self.__db_name.as_uri()}?mode=ro'
+        else:
+            db_uri = self.__db_name.as_uri()
+        db = sqlite3.connect(db_uri, uri=True, autocommit=autocommit,
+                             check_same_thread=check_same_thread,
+                             detect_types=sqlite3.PARSE_DECLTYPES|sqlite3.PARSE_COLNAMES)
+        if self.__immutable:
+            db.execute(f'pragma mmap_size={int(self.__mmap_size)}')
+            db.execute('pragma query_only=1')
+        return db
 
     def open(self, read_only: bool=False):
     #=====================================
+        """
+        Open the knowledge base, upgrading its schema if necessary.
+
+        An immutable knowledge base is memory mapped and its schema isn't checked;
+        it must not be changed, nor have an unmerged WAL, while it is open.
+        """
         self.close()
         if self.__db_name is not None:
-            db_uri = f'{self.__db_name.as_uri()}?mode=ro' if read_only else self.__db_name.as_uri()
-            self.__db = sqlite3.connect(db_uri, uri=True, autocommit=False,
-                                        detect_types=sqlite3.PARSE_DECLTYPES|sqlite3.PARSE_COLNAMES)
-            if self.__db is not None:
+            if self.__concurrent and not read_only and not self.__immutable:
+                # Readers don't block the writer, nor the writer readers, with WAL. The
+                # journal mode persists and can't be changed within a transaction, so is
+                # set using a connection that isn't always in one
+                db = self.__connect(read_only, autocommit=True, check_same_thread=True)
+                db.execute('pragma journal_mode=wal')
+                db.close()
+            self.__db = self.__connect(read_only, autocommit=False, check_same_thread=not self.__concurrent)
+            if self.__db is not None and not self.__immutable:
                 if (schema_version := self.metadata('schema_version')) != SCHEMA_VERSION:
                     if read_only:
                         raise ValueError(f'Knowledge base schema requires an upgrade from version {schema_version} but opened read only...')
@@ -213,6 +605,8 @@ class KnowledgeBase(object):
                         schema_version = upgrade[0]
                         try:
                             self.__db.executescript(upgrade[1])
+                            if len(upgrade) > 2:
+                                upgrade[2](self.__db)
                         except sqlite3.Error as e:
                             self.__db.rollback()
                             raise ValueError(f'Unable to upgrade knowledge base schema to version {schema_version}: {str(e)}')
@@ -220,16 +614,17 @@ class KnowledgeBase(object):
 
     def metadata(self, name: str) -> Optional[str]:
     #==============================================
-        if self.__db is not None:
-            row = self.__db.execute('select value from metadata where name=?', (name,)).fetchone()
+        if (db := self.read_db) is not None:
+            row = db.execute('select value from metadata where name=?', (name,)).fetchone()
             if row is not None:
                 return row[0]
 
     def set_metadata(self, name: str, value: str):
     #=============================================
         if self.__db is not None:
-            self.__db.execute('replace into metadata values (?, ?)', (name,value))
-            self.__db.commit()
+            with self.__write_lock:
+                self.__db.execute('replace into metadata values (?, ?)', (name,value))
+                self.__db.commit()
 
 #===============================================================================
 
@@ -245,11 +640,46 @@ class KnowledgeStore(KnowledgeBase):
                        sckan_version: Optional[str]=None,
                        sckan_provenance=False,
                        use_sckan=True,
+                       cache: Optional[KnowledgeCache]=None,
+                       cache_size: Optional[int]=None,
+                       cache_policy: str=LRU_POLICY,
+                       concurrent=False,
+                       immutable=False,
+                       preload=False,
+                       unknown_entity_ttl: Optional[float]=UNKNOWN_ENTITY_TTL,
+                       knowledge_ttl: Optional[float]=None,
+                       generation_check_interval: float=GENERATION_CHECK_INTERVAL,
+                       lazy_knowledge=False,
                        verbose=True):
-        super().__init__(store_directory, create=create, knowledge_base=knowledge_base, read_only=read_only)
-        self.__entity_knowledge: dict[tuple[Optional[str], str], dict[str, Any]] = {}     # Cache lookups
+        self.__preload_thread: Optional[threading.Thread] = None
+        self.__preload_stop = threading.Event()
+        self.__preload_progress: dict[str, Any] = {'loaded': 0, 'total': 0, 'done': False}
+        self.__refresh_thread: Optional[threading.Thread] = None
+        self.__refresh_stop = threading.Event()
+        self.__refresh_queue: queue.Queue[str] = queue.Queue()
+        self.__refresh_pending: set[str] = set()
+        self.__refresh_lock = threading.Lock()
+        self.__knowledge_ttl = knowledge_ttl
+        super().__init__(store_directory, create=create, knowledge_base=knowledge_base, read_only=read_only,
+                         concurrent=concurrent, immutable=immutable)
+        # Cache lookups, keyed by ``(source, entity)``
+        self.__entity_knowledge = cache if cache is not None else knowledge_cache(cache_policy, cache_size)
+        # The cache is cleared when another connection changes the knowledge base's
+        # generation, which is checked whenever SQLite's ``data_version`` changes.
+        # ``data_version`` is checked at most once every ``generation_check_interval``
+        self.__generation = int(self.metadata('generation') or 0)
+        self.__data_versions = threading.local()
+        self.__generation_check_interval = generation_check_interval
+        self.__generation_checked: Optional[float] = None
+        # SCKAN lookups in progress, keyed by ``(source, entity)``
+        self.__in_flight: dict[tuple[Optional[str], str], tuple[Future, int]] = {}
+        self.__in_flight_lock = threading.Lock()
+        self.__stats = KnowledgeStats()
         self.__npo_entities: set[str] = set()
         self.__sckan_provenance: dict[str, Optional[str]|dict[str, str]] = {}
+        self.__unknown_entity_ttl = unknown_entity_ttl
+        # Return stored knowledge as ``LazyKnowledge`` records
+        self.__lazy_knowledge = lazy_knowledge
         self.__verbose = verbose
 
         if (db_name := self.db_name) is not None:
@@ -320,9 +750,25 @@ class KnowledgeStore(KnowledgeBase):
             self.clean_connectivity(self.__source)
 
         # Remove `-npo` suffixes used to identify knowledge sources in database tables
-        if self.db is not None:
+        if self.db is not None and not immutable:
             self.__clean_source_suffix()
 
+        # Optionally refresh stale knowledge from SCKAN in the background
+        if (knowledge_ttl is not None and self.db is not None and self.__source is not None
+        and (self.__npo_db is not None or self.__scicrunch is not None)):
+            if not concurrent:
+                raise ValueError('Refreshing stale knowledge requires `concurrent=True`')
+            self.__refresh_thread = threading.Thread(target=self.__refresh, name='knowledge-refresh', daemon=True)
+            self.__refresh_thread.start()
+
+        # Optionally warm up our cache in the background
+        if preload and self.db is not None and self.__source is not None:
+            if not concurrent:
+                raise ValueError('Preloading knowledge requires `concurrent=True`')
+            self.__preload_thread = threading.Thread(target=self.__preload, args=(self.__source, ),
+                                                     name='knowledge-preload', daemon=True)
+            self.__preload_thread.start()
+
     @property
     def source(self):
         return self.__source
@@ -331,8 +777,126 @@ class KnowledgeStore(KnowledgeBase):
     def sckan_provenance(self):
         return self.__sckan_provenance
 
-    def __log_errors(self, entity: str, knowledge: dict):
-    #==============================================
+    @property
+    def generation(self) -> int:
+    #===========================
+        """
+        The generation of the knowledge base that the store's cache reflects.
+        """
+        return self.__generation
+
+    @property
+    def generation_check_due(self) -> bool:
+    #======================================
+        """
+        Whether the knowledge base's generation will be checked before the cache is next used.
+        """
+        return (self.__generation_checked is None
+             or time.monotonic() - self.__generation_checked >= self.__generation_check_interval)
+
+    @property
+    def cache_stats(self) -> dict[str, Any]:
+    #=======================================
+        """
+        Hit, miss and eviction counts, along with the current and maximum
+        sizes, of the store's knowledge cache.
+        """
+        return self.__entity_knowledge.stats
+
+    @property
+    def preload_progress(self) -> dict[str, Any]:
+    #============================================
+        """
+        The number of entities ``loaded`` into the cache from the ``total`` in
+        the store's source, and whether preloading is ``done``.
+        """
+        return dict(self.__preload_progress)
+
+    def clear_cache(self):
+    #=====================
+        self.__entity_knowledge.clear()
+
+    def stats(self) -> dict[str, Any]:
+    #=================================
+        """
+        A snapshot of the store's instrumentation.
+
+        :returns:   For each of the ``cache``, ``sqlite``, ``npo``, ``scicrunch`` and
+                    ``write`` tiers, the number of operations along with their ``total``
+                    and ``max`` times and latency ``histogram``. The ``cache`` tier also
+                    has the cache's statistics.
+        """
+        stats = self.__stats.snapshot()
+        stats[CACHE_TIER].update(self.__entity_knowledge.stats)
+        return stats
+
+    def reset_stats(self):
+    #=====================
+        self.__stats.reset()
+        self.__entity_knowledge.reset_stats()
+
+    def close(self):
+    #===============
+        if self.__preload_thread is not None:
+            self.__preload_stop.set()
+            self.__preload_thread.join()
+            self.__preload_thread = None
+        if self.__refresh_thread is not None:
+            self.__refresh_stop.set()
+            self.__refresh_thread.join()
+            self.__refresh_thread = None
+        super().close()
+
+    def wait_for_preload(self, timeout: Optional[float]=None) -> bool:
+    #=================================================================
+        """
+        Wait for preloading of the cache to finish.
+
+        :returns:   ``True`` unless the timeout expired
+        """
+        if self.__preload_thread is not None:
+            self.__preload_thread.join(timeout)
+            return not self.__preload_thread.is_alive()
+        return True
+
+    def __preload(self, source: str):
+    #================================
+        db = self.read_db
+        assert db is not None
+        self.__preload_progress['total'] = db.execute(f'''{SOURCE_LINEAGE}
+            select count(*) from knowledge as k join lineage as l on k.source=l.source where {VISIBLE_KNOWLEDGE}''',
+                                                                            (source, )).fetchone()[0]
+        if self.__verbose:
+            self.log.info(f"Preloading {self.__preload_progress['total']} entities from `{source}`...")
+        cursor = db.execute(f'''{SOURCE_LINEAGE}
+            select k.entity, b.knowledge, k.label, k.long_label, k.type, k.fetched_at
+                from knowledge as k join lineage as l on k.source=l.source
+                join knowledge_blobs as b on b.hash=k.hash where {VISIBLE_KNOWLEDGE}''',
+                                                                            (source, ))
+        try:
+            while not self.__preload_stop.is_set() and len(rows := cursor.fetchmany(BATCH_QUERY_SIZE)):
+                for row in rows:
+                    knowledge = self.__knowledge_record(row[1], source, row[2:5])
+                    if 'label' not in knowledge:
+                        knowledge['label'] = row[0]
+                    fetched_at = self.__check_fresh(row[0], source, row[5])
+                    if not self.__entity_knowledge.add((source, row[0]), (knowledge, fetched_at)):
+                        self.__preload_stop.set()
+                        if self.__verbose:
+                            self.log.warning('Knowledge cache is full, preloading stopped')
+                        break
+                    self.__preload_progress['loaded'] += 1
+        finally:
+            cursor.close()
+        self.__preload_progress['done'] = True
+        if self.__verbose:
+            self.log.info(f"Preloaded {self.__preload_progress['loaded']} entities from `{source}`")
+
+    def __log_errors(self, entity: str, knowledge: Knowledge):
+    #=========================================================
+        if isinstance(knowledge, LazyKnowledge) and not knowledge.decoded:
+            # Don't decode knowledge just to check it for errors
+            return
         for error in knowledge.get('errors', []):
             self.log.error(f'SCKAN knowledge error: {entity}: {error}')
 
@@ -341,22 +905,23 @@ class KnowledgeStore(KnowledgeBase):
         if self.db is not None and knowledge_source is not None:
             if self.__verbose:
                 self.log.info(f'Clearing connectivity knowledge for `{knowledge_source}`...')
-            namespaces = [f'{APINATOMY_MODEL_PREFIX}%']
-            namespaces.extend([f'{ontology}:%' for ontology in CONNECTIVITY_ONTOLOGIES])
-            condition = ' or '.join(len(namespaces)*['entity like ?'])
-            params = [knowledge_source] + namespaces
-            self.db.execute(f'delete from knowledge where (source=? or source is null) and ({condition})', tuple(params))
-            connectivity_terms = set()
-            for row in self.db.execute(
-                    f'select distinct node from connectivity_nodes where source=? or source is null', (knowledge_source,)).fetchall():
-                node = json.loads(row[0])
-                connectivity_terms.update([node[0]] + list(node[1]))
-            connectivity_entities = list(connectivity_terms)
-            condition = ', '.join(len(connectivity_entities)*'?')
-            self.db.execute(f'delete from knowledge where (source=? or source is null) and entity in ({condition})',
-                                                            tuple([knowledge_source] + connectivity_entities))
-            self.db.execute(f'delete from connectivity_nodes where source=? or source is null', (knowledge_source,))
-            self.db.commit()
+            # Entities in connectivity namespaces are deleted as ranges of the
+            # ``(source, entity)`` index and the terms used by connectivity are
+            # taken from ``connectivity_terms``, so that everything is set-based
+            with self.write_lock:
+                for source in (knowledge_source, None):
+                    for prefix in CONNECTIVITY_NAMESPACES:
+                        self.db.execute('delete from knowledge where source is ? and entity >= ? and entity < ?',
+                                                                (source, prefix, prefix_upper_bound(prefix)))
+                    self.db.execute('''delete from knowledge where source is ? and entity in
+                                        (select term from connectivity_terms where source=? or source is null)''',
+                                                                (source, knowledge_source))
+                for source in (knowledge_source, None):
+                    self.db.execute('delete from connectivity_terms where source is ?', (source, ))
+                    self.db.execute('delete from connectivity_nodes where source is ?', (source, ))
+                self.__bump_generation()
+                self.db.commit()
+            self.__entity_knowledge.clear()
 
     ### Is this still relevanty???
     def connectivity_models(self) -> list[str]:
@@ -401,136 +966,894 @@ class KnowledgeStore(KnowledgeBase):
             self.log.warning('NPO terms requested but no connection to NPO service')
         return []
 
-    def entity_knowledge(self, entity: str, source: Optional[str]=None) -> dict:
-    #===========================================================================
+    def cached_knowledge(self, entity: str, source: Optional[str]=None, check_generation: bool=True) -> Optional[Knowledge]:
+    #=======================================================================================================================
+        """
+        Get knowledge about an entity from the store's in-process cache.
+
+        :param check_generation:    Check if the cache needs clearing when the check is due.
+                                    The check reads the database so is otherwise left to
+                                    the caller, using ``check_generation()``
+        :returns:   The entity's knowledge or ``None`` if it isn't in the cache
+        """
+        if check_generation:
+            self.__check_generation()
+        return self.__cached_knowledge(entity, source)
+
+    def __cached_knowledge(self, entity: str, source: Optional[str]) -> Optional[Knowledge]:
+    #=======================================================================================
         use_source = self.__source if source is None else clean_knowledge_source(source)
+        with self.__stats.timed(CACHE_TIER):
+            cached = self.__entity_knowledge.get((use_source, entity))
+        if cached is None:
+            return None
+        (knowledge, fetched_at) = cached
+        if fetched_at is not None:
+            self.__check_fresh(entity, use_source, fetched_at)
+        self.__log_errors(entity, knowledge)
+        return knowledge
 
+    def check_generation(self):
+    #==========================
+        """
+        Clear the cache if another connection has changed the knowledge base's generation.
+        """
+        self.__generation_checked = time.monotonic()
+        if (db := self.read_db) is None or self.immutable:
+            return
+        data_version = db.execute('pragma data_version').fetchone()[0]
+        if getattr(self.__data_versions, 'value', None) != data_version:
+            self.__data_versions.value = data_version
+            row = db.execute("select value from metadata where name='generation'").fetchone()
+            generation = int(row[0]) if row is not None else 0
+            if generation != self.__generation:
+                self.__entity_knowledge.clear()
+                self.__generation = generation
+
+    def __check_generation(self):
+    #============================
+        if self.generation_check_due:
+            self.check_generation()
+
+    def __bump_generation(self):
+    #===========================
+        # Called in a write transaction, so we know if we were up-to-date
+        # before our change
+        assert self.db is not None
+        self.db.execute("update metadata set value=value+1 where name='generation'")
+        row = self.db.execute("select value from metadata where name='generation'").fetchone()
+        if row is not None and int(row[0]) == self.__generation + 1:
+            self.__generation = int(row[0])
+
+    def entity_knowledge(self, entity: str, source: Optional[str]=None) -> Knowledge:
+    #================================================================================
         # Check local cache
-        if (knowledge := self.__entity_knowledge.get((use_source, entity))) is not None:
-            self.__log_errors(entity, knowledge)
+        if (knowledge := self.cached_knowledge(entity, source)) is not None:
+            return knowledge
+        # Check our database
+        (knowledge, fetched_at) = self.__stored_entity_knowledge(entity, source)
+        return self.__complete_knowledge(entity, knowledge, source, fetched_at)
+
+    def entity_knowledge_json(self, entity: str, source: Optional[str]=None) -> tuple[str, str]:
+    #===========================================================================================
+        """
+        Get knowledge about an entity as JSON text, for passing directly to clients.
+
+        Stored knowledge with a label is returned without being decoded and
+        re-encoded, otherwise the entity's knowledge is looked up as by
+        :meth:`entity_knowledge`. Either way, the text is that of ``json.dumps()``
+        of the knowledge, including its ``source``, which is ``null`` for
+        knowledge without a source.
+
+        :returns:   The JSON text along with a hash of the knowledge, including
+                    its source, for use as an HTTP entity tag
+        """
+        row = self.__stored_entity_row(entity, source)
+        if row is not None and row[1] is not None and row[1] != entity:
+            self.__check_fresh(entity, row[0], row[6])
+            return (knowledge_json(row[3], source=row[0]), knowledge_etag(row[2], row[0]))
+        knowledge = dict(self.entity_knowledge(entity, source))
+        return (json.dumps(knowledge), knowledge_etag(knowledge_hash(knowledge), knowledge.get('source')))
+
+    def local_knowledge(self, entity: str, source: Optional[str]=None) -> Optional[Knowledge]:
+    #=========================================================================================
+        """
+        Get knowledge about an entity from the local cache or database, without
+        consulting SCKAN.
+
+        :returns:   The entity's knowledge or ``None`` if SCKAN needs to be consulted
+        """
+        if (knowledge := self.cached_knowledge(entity, source)) is not None:
             return knowledge
+        (knowledge, fetched_at) = self.__stored_entity_knowledge(entity, source)
+        if self.__sckan_lookup_needed(entity, knowledge, source):
+            return None
+        return self.__complete_knowledge(entity, knowledge, source, fetched_at)
+
+    def entity_knowledge_many(self, entities: Iterable[str], source: Optional[str]=None) -> dict[str, Knowledge]:
+    #============================================================================================================
+        """
+        Get knowledge about a collection of entities.
+
+        Entities not in the local cache are looked up in the local database
+        with a few chunked queries and only those that are still unknown are
+        then looked up in SCKAN.
+
+        :param entities:    The entities to get knowledge about
+        :param source:      The knowledge source to use; defaults to the store's source
+        :returns:           A dictionary of knowledge, keyed by entity
+        """
+        (entity_knowledge, unresolved) = self.__local_knowledge_many(entities, source)
+        for entity, knowledge in unresolved.items():
+            entity_knowledge[entity] = self.__complete_knowledge(entity, knowledge, source)
+        return entity_knowledge
+
+    def local_knowledge_many(self, entities: Iterable[str], source: Optional[str]=None) -> dict[str, Knowledge]:
+    #===========================================================================================================
+        """
+        Get knowledge about a collection of entities from the local cache or
+        database, without consulting SCKAN.
+
+        :returns:   A dictionary of knowledge, keyed by entity, for those entities
+                    that don't need SCKAN to be consulted
+        """
+        return self.__local_knowledge_many(entities, source)[0]
 
-        knowledge = {}
-        if self.db is not None:
-            # Check our database
-            if use_source is not None:
-                row = self.db.execute(
-                    'select source, knowledge from knowledge where source=? and entity=? order by source desc',
-                                                                            (use_source, entity)).fetchone()
+    def __local_knowledge_many(self, entities: Iterable[str], source: Optional[str]) -> tuple[dict[str, Knowledge], dict[str, Knowledge]]:
+    #=====================================================================================================================================
+        use_source = self.__source if source is None else clean_knowledge_source(source)
+        entity_knowledge: dict[str, Knowledge] = {}
+
+        # Check local cache, which is only invalidated once for the batch
+        self.__check_generation()
+        uncached_entities = []
+        for entity in dict.fromkeys(entities):
+            if (knowledge := self.__cached_knowledge(entity, source)) is not None:
+                entity_knowledge[entity] = knowledge
             else:
-                row = self.db.execute('select source, knowledge from knowledge where entity=? order by source desc',
-                                                                            (entity,)).fetchone()
-            if row is not None:
-                knowledge = json.loads(row[1])
-                knowledge['source'] = row[0]
+                uncached_entities.append(entity)
+
+        # Check our database
+        stored_knowledge: dict[str, Knowledge] = {}
+        fetched_times: dict[str, Optional[float]] = {}
+        if (db := self.read_db) is not None and len(uncached_entities):
+            with self.__stats.timed(SQLITE_TIER):
+                for start in range(0, len(uncached_entities), BATCH_QUERY_SIZE):
+                    batch = uncached_entities[start:start+BATCH_QUERY_SIZE]
+                    condition = ', '.join(len(batch)*'?')
+                    if use_source is not None:
+                        rows = db.execute(f'''{SOURCE_LINEAGE}
+                            select k.source, k.entity, b.knowledge, k.fetched_at, k.label, k.long_label, k.type
+                                from knowledge as k join lineage as l on k.source=l.source
+                                join knowledge_blobs as b on b.hash=k.hash
+                                where k.entity in ({condition}) and {VISIBLE_KNOWLEDGE}''',
+                                                                                tuple([use_source] + batch)).fetchall()
+                    else:
+                        rows = db.execute(
+                            f'''select k.source, k.entity, b.knowledge, k.fetched_at, k.label, k.long_label, k.type
+                                from knowledge as k join knowledge_blobs as b on b.hash=k.hash
+                                where k.entity in ({condition}) order by k.entity, k.source desc''',
+                                                                                tuple(batch)).fetchall()
+                    for row in rows:
+                        if row[1] not in stored_knowledge:
+                            knowledge = self.__knowledge_record(row[2], row[0] if use_source is None else use_source, row[4:7])
+                            stored_knowledge[row[1]] = knowledge
+                            fetched_times[row[1]] = self.__check_fresh(row[1], knowledge['source'], row[3])
+
+        # Entities that are still unknown need to be looked up in SCKAN
+        unresolved: dict[str, Knowledge] = {}
+        for entity in uncached_entities:
+            knowledge = stored_knowledge.get(entity, {})
+            if self.__sckan_lookup_needed(entity, knowledge, source):
+                unresolved[entity] = knowledge
+            else:
+                entity_knowledge[entity] = self.__complete_knowledge(entity, knowledge, source,
+                                                                     fetched_times.get(entity))
+        return (entity_knowledge, unresolved)
+
+    def __stored_entity_knowledge(self, entity: str, source: Optional[str]) -> tuple[Knowledge, Optional[float]]:
+    #============================================================================================================
+        # An entity's stored knowledge, along with when it was fetched if it's kept fresh
+        if (row := self.__stored_entity_row(entity, source)) is None:
+            return ({}, None)
+        knowledge = self.__knowledge_record(row[3], row[0], (row[1], row[4], row[5]))
+        return (knowledge, self.__check_fresh(entity, row[0], row[6]))
+
+    def __stored_entity_row(self, entity: str, source: Optional[str]) -> Optional[tuple]:
+    #====================================================================================
+        # The ``(source, label, hash, knowledge, long_label, type, fetched_at)`` of an entity's stored knowledge
+        use_source = self.__source if source is None else clean_knowledge_source(source)
+        row = None
+        if (db := self.read_db) is not None:
+            with self.__stats.timed(SQLITE_TIER):
+                if use_source is not None:
+                    row = db.execute(f'''{SOURCE_LINEAGE}
+                        select ?, k.label, k.hash, b.knowledge, k.long_label, k.type, k.fetched_at from knowledge as k
+                            join lineage as l on k.source=l.source join knowledge_blobs as b on b.hash=k.hash
+                            where k.entity=? and {VISIBLE_KNOWLEDGE}''', (use_source, use_source, entity)).fetchone()
+                else:
+                    row = db.execute('''select k.source, k.label, k.hash, b.knowledge, k.long_label, k.type, k.fetched_at
+                                            from knowledge as k
+                                            join knowledge_blobs as b on b.hash=k.hash
+                                            where k.entity=? order by k.source desc''', (entity,)).fetchone()
+        return row
+
+    def __knowledge_record(self, value: bytes|str, source: Optional[str],
+                           columns: tuple[Optional[str], Optional[str], Optional[str]]) -> Knowledge:
+    #============================================================================================================
+        # Stored knowledge, along with its source, given the ``label``, ``long_label``
+        # and ``type`` columns of its row
+        if self.__lazy_knowledge:
+            known: dict[str, Any] = {key: value for (key, value) in zip(['label', 'long-label', 'type'], columns)
+                                                    if value is not None}
+            known['source'] = source
+            return LazyKnowledge(value, known)
+        knowledge = decode_knowledge(value)
+        knowledge['source'] = source
+        return knowledge
 
-        if ((len(knowledge) == 0 or entity == knowledge.get('label', entity))
-        and (source is None or source == self.__source)):
-            # We don't have knowledge or a valid label for the entity so check SCKAN
-            ontology = entity.split(':')[0]
+    def __check_fresh(self, entity: str, source: Optional[str], fetched_at: Optional[float]) -> Optional[float]:
+    #===========================================================================================================
+        # Queue stale knowledge to be refreshed, while still using it. Returns when
+        # the knowledge was fetched, to be cached along with it, or ``None`` if it
+        # isn't kept fresh
+        if self.__knowledge_ttl is None or self.__refresh_thread is None or source != self.__source:
+            return None
+        if fetched_at is None or time.time() - fetched_at > self.__knowledge_ttl:
+            with self.__refresh_lock:
+                if entity in self.__refresh_pending:
+                    return fetched_at
+                self.__refresh_pending.add(entity)
+            self.__refresh_queue.put(entity)
+        return fetched_at
+
+    def __refresh(self):
+    #===================
+        assert self.db is not None
+        while not self.__refresh_stop.is_set():
+            try:
+                entities = [self.__refresh_queue.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            while len(entities) < REFRESH_BATCH_SIZE:
+                try:
+                    entities.append(self.__refresh_queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                refreshed_knowledge = {}
+                for entity in entities:
+                    knowledge = self.__fetch_sckan_knowledge(entity, {'id': entity})
+                    # Keep what we have if SCKAN no longer knows about the entity
+                    if entity != knowledge.get('label', entity):
+                        refreshed_knowledge[entity] = knowledge
+                unchanged = [entity for entity in entities if entity not in refreshed_knowledge]
+                # Connectivity may now use terms we don't yet know about
+                fetched_knowledge = dict(refreshed_knowledge)
+                self.__fetch_connectivity_terms(fetched_knowledge)
+                with self.write_lock, self.__stats.timed(WRITE_TIER):
+                    # Replace, rather than add to, the nodes of refreshed connectivity
+                    self.db.executemany('delete from connectivity_nodes where source=? and path=?',
+                                        ((self.__source, entity) for entity in refreshed_knowledge))
+                    self.__save_fetched_knowledge(fetched_knowledge)
+                    fetched_at = time.time()
+                    self.db.executemany('update knowledge set fetched_at=? where source=? and entity=?',
+                                        ((fetched_at, self.__source, entity) for entity in unchanged))
+                    self.db.commit()
+                # Unchanged knowledge is read again when next used, as it's now fresh
+                for entity in unchanged:
+                    self.__entity_knowledge.pop((self.__source, entity))
+                for entity, knowledge in fetched_knowledge.items():
+                    self.__finalise_knowledge(entity, knowledge, fetched_at)
+                if self.__verbose:
+                    self.log.info(f'Refreshed knowledge of {len(refreshed_knowledge)} stale entities')
+            except Exception as e:
+                self.log.error(f'Unable to refresh stale knowledge: {str(e)}')
+            finally:
+                with self.__refresh_lock:
+                    self.__refresh_pending.difference_update(entities)
+
+    def __sckan_lookup_needed(self, entity: str, knowledge: Knowledge, source: Optional[str]) -> bool:
+    #=================================================================================================
+        # We don't have knowledge or a valid label for the entity
+        return ((not knowledge or entity == knowledge.get('label', entity))
+            and (source is None or source == self.__source))
+
+    def __complete_knowledge(self, entity: str, knowledge: Knowledge, source: Optional[str], fetched_at: Optional[float]=None) -> Knowledge:
+    #=======================================================================================================================================
+        if self.__sckan_lookup_needed(entity, knowledge, source):
+            # We don't have knowledge or a valid label for the entity so check SCKAN,
+            # unless it recently didn't know about the entity
+            if not self.__unknown_entity(entity):
+                return self.__coalesced_sckan_knowledge(entity, knowledge)
+            knowledge['source'] = self.__source
+        return self.__finalise_knowledge(entity, knowledge, fetched_at)
+
+    def __unknown_entity(self, entity: str) -> bool:
+    #===============================================
+        if (self.__unknown_entity_ttl == 0 or (db := self.read_db) is None
+         or (self.__npo_db is None and self.__scicrunch is None)):
+            return False
+        row = db.execute('select checked from unknown_entities where source is ? and entity=?',
+                                                                    (self.__source, entity)).fetchone()
+        return (row is not None
+            and (self.__unknown_entity_ttl is None or row[0] > time.time() - self.__unknown_entity_ttl))
+
+    def __coalesced_sckan_knowledge(self, entity: str, knowledge: Knowledge) -> Knowledge:
+    #=====================================================================================
+        # Only have one SCKAN lookup in flight for an entity, with other callers
+        # waiting for its result. A recursive lookup by the thread that's already
+        # looking up the entity isn't coalesced, as it would wait on itself
+        key = (self.__source, entity)
+        with self.__in_flight_lock:
+            if (in_flight := self.__in_flight.get(key)) is None:
+                self.__in_flight[key] = (Future(), threading.get_ident())
+            (future, thread) = self.__in_flight[key]
+        if in_flight is not None:
+            if thread != threading.get_ident():
+                return future.result()
+            return self.__sckan_knowledge(entity, knowledge)
+        try:
+            knowledge = self.__sckan_knowledge(entity, knowledge)
+            future.set_result(knowledge)
+            return knowledge
+        except BaseException as exception:
+            future.set_exception(exception)
+            raise
+        finally:
+            with self.__in_flight_lock:
+                del self.__in_flight[key]
+
+    def __sckan_knowledge(self, entity: str, knowledge: Knowledge) -> Knowledge:
+    #===========================================================================
+        knowledge = self.__fetch_sckan_knowledge(entity, knowledge)
+        fetched_at = self.__check_fresh(entity, self.__source, time.time())
+        if self.db is None or self.read_only:
+            return self.__finalise_knowledge(entity, knowledge, fetched_at)
+
+        # Get knowledge about each entity used for connectivity so that it can
+        # all be saved at once
+        fetched_knowledge = {entity: knowledge}
+        self.__fetch_connectivity_terms(fetched_knowledge)
+        with self.write_lock, self.__stats.timed(WRITE_TIER):
+            self.__save_fetched_knowledge(fetched_knowledge)
+            self.db.commit()
 
-            # Always first consult NPO
-            if self.__verbose:
-                self.log.info(f'Consulting NPO for knowledge about {entity}')
-            if self.__npo_db:
+        for term, term_knowledge in fetched_knowledge.items():
+            if term != entity:
+                self.__finalise_knowledge(term, term_knowledge, fetched_at)
+        return self.__finalise_knowledge(entity, knowledge, fetched_at)
+
+    def __fetch_connectivity_terms(self, fetched_knowledge: dict[str, Knowledge]):
+    #=============================================================================
+        # Add knowledge about each entity used by the connectivity of fetched
+        # knowledge, and about any entities that they in turn use, that isn't
+        # stored locally
+        terms = set()
+        for knowledge in fetched_knowledge.values():
+            terms.update(connectivity_terms(knowledge))
+        while len(terms):
+            (_, unresolved) = self.__local_knowledge_many(terms, None)
+            terms = set()
+            for term, term_knowledge in unresolved.items():
+                if term in fetched_knowledge:
+                    continue
+                if self.__unknown_entity(term):
+                    term_knowledge['source'] = self.__source
+                    self.__finalise_knowledge(term, term_knowledge)
+                else:
+                    term_knowledge = self.__fetch_sckan_knowledge(term, term_knowledge)
+                    fetched_knowledge[term] = term_knowledge
+                    terms.update(connectivity_terms(term_knowledge))
+
+    def __save_fetched_knowledge(self, fetched_knowledge: dict[str, Knowledge]):
+    #===========================================================================
+        # Save knowledge fetched from SCKAN, remembering entities that SCKAN doesn't
+        # know about. The caller holds :attr:`write_lock` and commits the transaction
+        assert self.db is not None
+        self.save_knowledge_many((entity, knowledge) for entity, knowledge in fetched_knowledge.items()
+                                                        if len(knowledge) > 1)
+        self.db.executemany('delete from unknown_entities where source is ? and entity=?',
+                                ((self.__source, entity) for entity in fetched_knowledge))
+        if self.__unknown_entity_ttl != 0:
+            checked = time.time()
+            self.db.executemany('insert into unknown_entities (source, entity, checked) values (?, ?, ?)',
+                                ((self.__source, entity, checked) for entity, knowledge in fetched_knowledge.items()
+                                                        if entity == knowledge.get('label', entity)))
+
+    def __fetch_sckan_knowledge(self, entity: str, knowledge: Knowledge) -> Knowledge:
+    #=================================================================================
+        ontology = entity.split(':')[0]
+
+        # Always first consult NPO
+        if self.__verbose:
+            self.log.info(f'Consulting NPO for knowledge about {entity}')
+        if self.__npo_db:
+            with self.__stats.timed(NPO_TIER):
                 knowledge = self.__npo_db.get_knowledge(entity)
 
-            # If NPO doesn't know about the entity and its not connectivity
-            # related we consult SciCrunch
-            if (len(knowledge) == 1 and self.__scicrunch is not None
-            and not (entity in self.__npo_entities or ontology in CONNECTIVITY_ONTOLOGIES)):
-                if self.__verbose:
-                    self.log.info(f'Consulting SciCrunch for knowledge about {entity}')
+        # If NPO doesn't know about the entity and its not connectivity
+        # related we consult SciCrunch
+        if (len(knowledge) == 1 and self.__scicrunch is not None
+        and not (entity in self.__npo_entities or ontology in CONNECTIVITY_ONTOLOGIES)):
+            if self.__verbose:
+                self.log.info(f'Consulting SciCrunch for knowledge about {entity}')
+            with self.__stats.timed(SCICRUNCH_TIER):
                 knowledge = self.__scicrunch.get_knowledge(entity)
                 if 'connectivity' in knowledge:
                     # Get phenotype, taxon, and other metadata
                     knowledge.update(self.__scicrunch.connectivity_metadata(entity))
 
-            knowledge['source'] = self.__source
-            if len(knowledge) > 1 and self.db is not None and not self.read_only:
-                # Use 'long-label' if the entity's label' is the same as itself.
-                if 'label' in knowledge:
-                    if knowledge['label'] == entity and 'long-label' in knowledge:
-                        knowledge['label'] = knowledge['long-label']                # Save knowledge in our database
-                self.db.execute('replace into knowledge (source, entity, knowledge) values (?, ?, ?)',
-                                                    (self.__source, entity, json.dumps(knowledge)))
-                connectivity_terms = set()
-                if 'connectivity' in knowledge:
-                    seen_nodes = set()
-                    for edge in knowledge['connectivity']:
-                        for node in edge:
-                            if node not in seen_nodes:
-                                seen_nodes.add(node)
-                                self.db.execute('replace into connectivity_nodes (source, node, path) values (?, ?, ?)',
-                                                                              (self.__source, json.dumps(node), entity))
-                                connectivity_terms.update([node[0]] + list(node[1]))
-
-                # Finished entity specific updates so commit transaction
-                self.db.commit()
-
-                # Now make sure we have knowledge for each entity used for connectivity
-                for term in connectivity_terms:
-                    self.entity_knowledge(term)
+        knowledge['source'] = self.__source
+        # Use 'long-label' for saved knowledge if the entity's label' is the same as itself.
+        if (self.db is not None and not self.read_only
+        and knowledge.get('label') == entity and 'long-label' in knowledge):
+            knowledge['label'] = knowledge['long-label']
+        return knowledge
 
+    def __finalise_knowledge(self, entity: str, knowledge: Knowledge, fetched_at: Optional[float]=None) -> Knowledge:
+    #================================================================================================================
         # Use the entity's value as its label if none is defined
         if 'label' not in knowledge:
             knowledge['label'] = entity
 
-        # Cache local knowledge
+        # Cache local knowledge, along with when it was fetched if it's kept fresh
         if 'source' in knowledge:
-            self.__entity_knowledge[(knowledge['source'], entity)] = knowledge
+            self.__entity_knowledge.put((knowledge['source'], entity), (knowledge, fetched_at))
 
         # Log any errors
         self.__log_errors(entity, knowledge)
 
         return knowledge
 
+    def create_overlay_source(self, source: str, parent: str):
+    #=========================================================
+        """
+        Create a knowledge source that overlays a parent source.
+
+        Lookups in the overlay fall through to the parent for entities that the
+        overlay has no knowledge of, other than those of the parent's connectivity,
+        and knowledge saved in the overlay that is unchanged from what it inherits
+        isn't stored.
+
+        :param source:  The new knowledge source
+        :param parent:  An existing knowledge source
+        """
+        if self.db is None or self.read_only:
+            raise ValueError('Overlay sources can only be created in a writable knowledge store')
+        source = clean_knowledge_source(source)
+        parent = clean_knowledge_source(parent)
+        sources = self.knowledge_sources()
+        if source in sources:
+            raise ValueError(f'Knowledge source `{source}` already exists')
+        if parent not in sources:
+            raise ValueError(f'Unknown parent knowledge source: `{parent}`')
+        with self.write_lock:
+            # A source that no longer has any knowledge still has a row
+            self.db.execute('''insert into knowledge_sources (source, parent, created) values (?, ?, ?)
+                                on conflict (source) do update set parent=excluded.parent, created=excluded.created''',
+                                                                                (source, parent, time.time()))
+            self.db.commit()
+
+    def source_parent(self, source: str) -> Optional[str]:
+    #=====================================================
+        """
+        The parent source of an overlay knowledge source, or ``None``.
+        """
+        if (db := self.read_db) is not None:
+            row = db.execute('select parent from knowledge_sources where source=?',
+                                                                (clean_knowledge_source(source), )).fetchone()
+            if row is not None:
+                return row[0]
+
     def knowledge_sources(self) -> list[str]:
     #========================================
-        if self.db:
+        if (db := self.read_db) is not None:
             sources = [clean_knowledge_source(row[0])
-                        for row in self.db.execute('select distinct source from knowledge').fetchall()
-                            if row[0] is not None]
+                        for row in db.execute('select source from knowledge_sources where entities > 0 or parent is not null').fetchall()]
             return sorted(set(sources), reverse=True)
         return []
 
+    def source_metadata(self, source: str) -> Optional[dict[str, Any]]:
+    #==================================================================
+        """
+        Metadata about a knowledge source.
+
+        :returns:   The number of ``entities`` the source has knowledge of, excluding
+                    any it inherits, when it was ``created``, its ``parent`` source
+                    and its SCKAN ``provenance``, or ``None`` if the source is unknown
+        """
+        if (db := self.read_db) is not None:
+            row = db.execute('select entities, created, parent, provenance from knowledge_sources where source=?',
+                                                                (clean_knowledge_source(source), )).fetchone()
+            if row is not None:
+                return {
+                    'entities': row[0],
+                    'created': row[1],
+                    'parent': row[2],
+                    'provenance': json.loads(row[3]) if row[3] is not None else None
+                }
+
     def label(self, entity: str) -> str:
     #===================================
         knowledge = self.entity_knowledge(entity)
-        return knowledge.get('label', knowledge['id'])
+        return knowledge.get('label') or knowledge['id']
 
-    def labels(self) -> list[tuple[str, str]]:
-    #=========================================
-        return [(kn['id'], kn.get('label', kn['id'])) for kn in self.stored_knowledge()]
-
-    def stored_knowledge(self, source: Optional[str]=None) -> list[dict]:
-    #====================================================================
-        stored_knowledge = []
+    def labels(self, source: Optional[str]=None) -> list[tuple[str, str]]:
+    #=====================================================================
+        labels = []
         source = self.__source if source is None else clean_knowledge_source(source)
-        if self.db is not None:
+        if (db := self.read_db) is not None:
             if source is not None:
-                rows = self.db.execute(
-                    'select source, entity, knowledge from knowledge where source=? or source is null order by entity, source desc',
-                                                                            (source, )).fetchall()
+                rows = db.execute(f'''{SOURCE_LINEAGE}
+                    select k.entity, k.label, 0 from knowledge as k join lineage as l on k.source=l.source where {VISIBLE_KNOWLEDGE}
+                    union all
+                    select entity, label, 1 from knowledge where source is null
+                    order by 1, 3''', (source, )).fetchall()
             else:
-                rows = self.db.execute('select source, entity, knowledge from knowledge order by entity, source desc').fetchall()
+                rows = db.execute('select entity, label from knowledge order by entity, source desc').fetchall()
             last_entity = None
             for row in rows:
-                if row[1] != last_entity:
-                    knowledge = json.loads(row[2])
-                    knowledge['source'] = row[0]
-                    stored_knowledge.append(knowledge)
-                    last_entity = row[1]
-        return stored_knowledge
+                if row[0] != last_entity:
+                    labels.append((row[0], row[1] if row[1] is not None else row[0]))
+                    last_entity = row[0]
+        return labels
+
+    def paths_through(self, term: str, source: Optional[str]=None) -> list[str]:
+    #===========================================================================
+        """
+        Find the connectivity paths that pass through an anatomical term, either
+        as a region or as a layer.
+
+        :param term:    The anatomical term
+        :param source:  The knowledge source to use; defaults to the store's source
+        :returns:       The paths through the term
+        """
+        source = self.__source if source is None else clean_knowledge_source(source)
+        if (db := self.read_db) is not None:
+            if source is not None:
+                rows = db.execute('select distinct path from connectivity_terms where term=? and (source=? or source is null) order by path',
+                                                                            (term, source)).fetchall()
+            else:
+                rows = db.execute('select distinct path from connectivity_terms where term=? order by path',
+                                                                            (term, )).fetchall()
+            return [row[0] for row in rows]
+        return []
+
+    def search_labels(self, query: str, limit: int=20, source: Optional[str]=None) -> list[tuple[str, str]]:
+    #=======================================================================================================
+        """
+        Find entities with labels or long labels that match a query.
+
+        Each word of the query is matched as a prefix of words in labels, with
+        results ranked by relevance and matches of labels ranked above those of
+        long labels.
+
+        :param query:   The text to search for
+        :param limit:   The maximum number of results
+        :param source:  The knowledge source to search; defaults to the store's source
+        :returns:       A list of ``(entity, label)`` pairs, best matches first
+        """
+        source = self.__source if source is None else clean_knowledge_source(source)
+        words = [word.replace('"', '""') for word in query.split()]
+        terms = ' '.join(f'"{word}"*' for word in words)
+        if len(terms) == 0 or (db := self.read_db) is None:
+            return []
+        # An entity's label is taken from the row that :meth:`labels` would use, with
+        # the entity ranked by its best matching row
+        if source is not None:
+            rows = db.execute(f'''{SOURCE_LINEAGE},
+                matches(entity, label, fallback, score) as (
+                    select k.entity, k.label, k.source is null, bm25(knowledge_labels, 10.0, 1.0)
+                        from knowledge_labels as f join knowledge as k on k.rowid=f.rowid
+                        left join lineage as l on k.source=l.source
+                        where knowledge_labels match ? and (k.source is null or (l.depth is not null and {VISIBLE_KNOWLEDGE})))
+                select entity, label from (
+                    select entity, label, row_number() over (partition by entity order by fallback) as n,
+                           min(score) over (partition by entity) as rank from matches)
+                    where n=1 order by rank limit ?''',
+                                                                            (source, terms, limit)).fetchall()
+        else:
+            rows = db.execute('''with matches(entity, label, source, score) as (
+                                    select k.entity, k.label, k.source, bm25(knowledge_labels, 10.0, 1.0)
+                                        from knowledge_labels as f join knowledge as k on k.rowid=f.rowid
+                                        where knowledge_labels match ?)
+                                select entity, label from (
+                                    select entity, label, row_number() over (partition by entity order by source desc nulls last) as n,
+                                           min(score) over (partition by entity) as rank from matches)
+                                    where n=1 order by rank limit ?''',
+                                                                            (terms, limit)).fetchall()
+        return [(row[0], row[1] if row[1] is not None else row[0]) for row in rows]
+
+    def save_knowledge(self, entity: str, knowledge: dict, source: Optional[str]=None) -> set[str]:
+    #==============================================================================================
+        """
+        Save knowledge about an entity, along with the nodes of any connectivity,
+        in the local database.
+
+        The caller is responsible for holding :attr:`write_lock` and for committing
+        the transaction.
+
+        :returns:   The anatomical terms used by the entity's connectivity
+        """
+        self.save_knowledge_many([(entity, knowledge)], source)
+        return connectivity_terms(knowledge)
+
+    def save_knowledge_many(self, entity_knowledge: Iterable[tuple[str, Knowledge]], source: Optional[str]=None):
+    #============================================================================================================
+        """
+        Save knowledge about a number of entities, along with the nodes of any
+        connectivity, in the local database.
+
+        The caller is responsible for holding :attr:`write_lock` and for committing
+        the transaction.
+
+        :param entity_knowledge:    ``(entity, knowledge)`` pairs to save
+        """
+        assert self.db is not None
+        source = self.__source if source is None else clean_knowledge_source(source)
+        self.__bump_generation()
+        fetched_at = time.time()
+        knowledge_rows = []
+        blob_rows = {}
+        node_rows = []
+        for (entity, knowledge) in entity_knowledge:
+            knowledge_rows.append((source, entity) + knowledge_columns(knowledge) + (fetched_at, ))
+            (hash, blob) = knowledge_blob(knowledge)
+            blob_rows.setdefault(hash, blob)
+            node_rows.extend([(source, json.dumps(node), entity) for node in connectivity_nodes(knowledge)])
+        if source is not None and (parent := self.source_parent(source)) is not None:
+            # An overlay only stores knowledge that differs from what it inherits,
+            # with the row it's inherited from being marked as just fetched
+            inherited_rows = []
+            fetched_rows = []
+            inherited_hashes = self.__inherited_hashes(parent, [row[1] for row in knowledge_rows])
+            for row in knowledge_rows:
+                (has_connectivity, hash) = row[-3:-1]
+                if (inherited := inherited_hashes.get(row[1])) is not None and inherited[1] == hash and not has_connectivity:
+                    inherited_rows.append(row[:2])
+                    fetched_rows.append((fetched_at, inherited[0], row[1]))
+            self.db.executemany('update knowledge set fetched_at=? where source=? and entity=?', fetched_rows)
+            self.db.executemany('delete from knowledge where source=? and entity=?', inherited_rows)
+            inherited_rows = set(inherited_rows)
+            knowledge_rows = [row for row in knowledge_rows if row[:2] not in inherited_rows]
+        self.db.executemany(KNOWLEDGE_BLOB_INSERT, blob_rows.items())
+        self.db.executemany(KNOWLEDGE_INSERT, knowledge_rows)
+        self.db.executemany('replace into connectivity_nodes (source, node, path) values (?, ?, ?)', node_rows)
+        if source is not None and source == self.__source and ('npo' in self.__sckan_provenance
+                                                               or 'scicrunch' in self.__sckan_provenance):
+            self.db.execute('update knowledge_sources set provenance=? where source=? and provenance is null',
+                                                                (json.dumps(self.__sckan_provenance), source))
+
+    def __inherited_hashes(self, parent: str, entities: list[str]) -> dict[str, tuple[str, str]]:
+    #============================================================================================
+        # The source and hash of the knowledge each entity inherits from a parent source
+        assert self.db is not None
+        hashes = {}
+        for start in range(0, len(entities), BATCH_QUERY_SIZE):
+            batch = entities[start:start+BATCH_QUERY_SIZE]
+            condition = ', '.join(len(batch)*'?')
+            hashes.update((row[0], row[1:]) for row in self.db.execute(f'''{SOURCE_LINEAGE}
+                select k.entity, k.source, k.hash from knowledge as k join lineage as l on k.source=l.source
+                    where k.entity in ({condition}) and {VISIBLE_KNOWLEDGE} and {INHERITED_KNOWLEDGE}''',
+                                                                        tuple([parent] + batch)).fetchall())
+        return hashes
+
+    def stored_entities_of_type(self, anatomical_type: str, source: Optional[str]=None) -> list[str]:
+    #================================================================================================
+        source = self.__source if source is None else clean_knowledge_source(source)
+        if (db := self.read_db) is not None:
+            if source is not None:
+                rows = db.execute(f'''{SOURCE_LINEAGE}
+                    select k.entity from knowledge as k join lineage as l on k.source=l.source
+                        where k.type=? and {VISIBLE_KNOWLEDGE}
+                    union
+                    select entity from knowledge where source is null and type=?
+                    order by 1''', (source, anatomical_type, anatomical_type)).fetchall()
+            else:
+                rows = db.execute('select distinct entity from knowledge where type=? order by entity',
+                                                                            (anatomical_type, )).fetchall()
+            return [row[0] for row in rows]
+        return []
+
+    def stored_paths(self, source: Optional[str]=None) -> list[str]:
+    #===============================================================
+        source = self.__source if source is None else clean_knowledge_source(source)
+        if (db := self.read_db) is not None:
+            if source is not None:
+                rows = db.execute('select distinct entity from knowledge where (source=? or source is null) and has_connectivity=1 order by entity',
+                                                                            (source, )).fetchall()
+            else:
+                rows = db.execute('select distinct entity from knowledge where has_connectivity=1 order by entity').fetchall()
+            return [row[0] for row in rows]
+        return []
+
+    def stored_knowledge(self, source: Optional[str]=None) -> list[Knowledge]:
+    #=========================================================================
+        return list(self.iter_stored_knowledge(source))
+
+    def iter_stored_knowledge(self, source: Optional[str]=None, batch_size: int=BATCH_QUERY_SIZE) -> Iterator[Knowledge]:
+    #====================================================================================================================
+        """
+        Iterate over the knowledge held in the local database, in entity order,
+        reading rows from the database in batches.
+
+        :param source:      The knowledge source to use; defaults to the store's source
+        :param batch_size:  The number of rows to read from the database at a time
+        """
+        for (entity, knowledge) in self.__iter_stored_rows(source, None, batch_size):
+            yield knowledge
+
+    def diff_sources(self, old_source: str, new_source: str) -> Iterator[tuple[str, str]]:
+    #=====================================================================================
+        """
+        Compare the knowledge held in the local database for two knowledge sources.
+
+        :param old_source:  The earlier knowledge source
+        :param new_source:  The later knowledge source
+        :returns:           An iterator over ``(entity, change)`` pairs, in entity order,
+                            where ``change`` is one of ``added``, ``removed`` or ``changed``
+        """
+        if (db := self.read_db) is None:
+            return
+        old_rows = self.__iter_source_hashes(db, clean_knowledge_source(old_source))
+        new_rows = self.__iter_source_hashes(db, clean_knowledge_source(new_source))
+        # Merge the two sources' rows, which are in entity order
+        rows = heapq.merge(((row[0], 0, row[1]) for row in old_rows), ((row[0], 1, row[1]) for row in new_rows))
+        for (entity, entity_rows) in itertools.groupby(rows, key=lambda row: row[0]):
+            hashes = {row[1]: row[2] for row in entity_rows}
+            if 0 not in hashes:
+                yield (entity, 'added')
+            elif 1 not in hashes:
+                yield (entity, 'removed')
+            elif hashes[0] != hashes[1]:
+                yield (entity, 'changed')
+
+    def export_source(self, source: str, knowledge_base: str|Path):
+    #==============================================================
+        """
+        Export a knowledge source, along with the knowledge it inherits and
+        knowledge that has no source, to a new knowledge base file.
+
+        :param source:          The knowledge source to export
+        :param knowledge_base:  The path of the new knowledge base, which mustn't exist
+        """
+        if self.db_name is None:
+            raise ValueError('Knowledge can only be exported from a local knowledge store')
+        source = clean_knowledge_source(source)
+        if source not in self.knowledge_sources():
+            raise ValueError(f'Unknown knowledge source: `{source}`')
+        export_path = Path(knowledge_base).resolve()
+        if export_path.exists():
+            raise ValueError(f'Knowledge base already exists: {export_path}')
+        KnowledgeBase(export_path.parent, create=True, knowledge_base=export_path.name).close()
+        columns = ', '.join(KNOWLEDGE_VALUE_COLUMNS)
+        # Our connections can't ATTACH, so use a separate one that only ever
+        # writes to the attached knowledge base, whose triggers index labels
+        # and connectivity terms
+        db = sqlite3.connect(self.db_name, autocommit=True)
+        try:
+            db.execute('attach database ? as export', (str(export_path), ))
+            db.execute('begin')
+            db.execute(f'''{SOURCE_LINEAGE}
+                insert or ignore into export.knowledge_blobs (hash, knowledge)
+                    select b.hash, b.knowledge from knowledge as k join knowledge_blobs as b on b.hash=k.hash
+                        left join lineage as l on k.source=l.source
+                        where k.source is null or (l.depth is not null and {VISIBLE_KNOWLEDGE})''', (source, ))
+            db.execute(f'''{SOURCE_LINEAGE}
+                insert into export.knowledge (source, entity, {columns}, fetched_at)
+                    select ?, k.entity, {', '.join(f'k.{column}' for column in KNOWLEDGE_VALUE_COLUMNS)}, k.fetched_at
+                        from knowledge as k join lineage as l on k.source=l.source where {VISIBLE_KNOWLEDGE}
+                    union all
+                    select null, entity, {columns}, fetched_at from knowledge where source is null''',
+                                                                                (source, source))
+            db.execute('''insert into export.connectivity_nodes (source, node, path)
+                            select source, node, path from connectivity_nodes where source=? or source is null''',
+                                                                                (source, ))
+            db.execute('''insert into export.unknown_entities (source, entity, checked)
+                            select source, entity, checked from unknown_entities where source=? or source is null''',
+                                                                                (source, ))
+            db.execute('''update export.knowledge_sources set provenance=
+                            (select provenance from knowledge_sources where source=?) where source=?''',
+                                                                                (source, source))
+            # Exported sources have no ``-npo`` suffixes
+            db.execute("replace into export.metadata (name, value) values ('clean-source-suffix', '1')")
+            db.execute('commit')
+            db.execute('detach database export')
+        except sqlite3.Error:
+            if db.in_transaction:
+                db.execute('rollback')
+            raise
+        finally:
+            db.close()
+        if self.__verbose:
+            self.log.info(f'Exported knowledge source `{source}` to {export_path}')
+
+    def __iter_source_hashes(self, db: sqlite3.Connection, source: str) -> Iterator[tuple[str, str]]:
+    #================================================================================================
+        cursor = db.execute(f'''{SOURCE_LINEAGE}
+            select k.entity, k.hash from knowledge as k join lineage as l on k.source=l.source
+                where {VISIBLE_KNOWLEDGE} order by k.entity''', (source, ))
+        try:
+            while len(rows := cursor.fetchmany(BATCH_QUERY_SIZE)):
+                yield from rows
+        finally:
+            cursor.close()
+
+    def stored_knowledge_page(self, after_entity: Optional[str]=None, limit: int=100,
+                              source: Optional[str]=None) -> tuple[list[Knowledge], Optional[str]]:
+    #======================================================================================
+        """
+        Get a page of the knowledge held in the local database, in entity order.
+
+        :param after_entity:    The page starts with the entity following this one;
+                                the first page if ``None``
+        :param limit:           The maximum number of entities in the page
+        :param source:          The knowledge source to use; defaults to the store's source
+        :returns:               The page's knowledge along with the ``after_entity``
+                                of the next page, or ``None`` if there are no more pages
+        """
+        page = []
+        last_entity = None
+        for (entity, knowledge) in self.__iter_stored_rows(source, after_entity, limit + 1):
+            if len(page) == limit:
+                return (page, last_entity)
+            page.append(knowledge)
+            last_entity = entity
+        return (page, None)
+
+    def __iter_stored_rows(self, source: Optional[str], after_entity: Optional[str], batch_size: int) -> Iterator[tuple[str, Knowledge]]:
+    #====================================================================================================================================
+        source = self.__source if source is None else clean_knowledge_source(source)
+        if (db := self.read_db) is None:
+            return
+        # Sources are read in order of preference, with knowledge that has no source
+        # last. A source's rows are read in batches, in the order of ``knowledge_index``
+        if source is not None:
+            sources = [row[0] for row in db.execute(f'''{SOURCE_LINEAGE}
+                select source from lineage order by depth''', (source, )).fetchall()]
+        else:
+            sources = [row[0] for row in db.execute('''select distinct source from knowledge
+                where source is not null order by source desc''').fetchall()]
+        sources.append(None)
+        rows = heapq.merge(*[self.__iter_source_rows(db, row_source, rank, after_entity, batch_size)
+                                for (rank, row_source) in enumerate(sources)])
+        for (entity, entity_rows) in itertools.groupby(rows, key=lambda row: row[0]):
+            row = next(entity_rows)
+            if source is not None and row[3] is not None and row[1] > 0 and not row[2]:
+                # Connectivity isn't inherited, so fall back to knowledge without a source
+                if (row := next((row for row in entity_rows if row[3] is None), None)) is None:
+                    continue
+            # Inherited knowledge belongs to the source it's inherited by
+            knowledge = self.__knowledge_record(row[4],
+                source if row[3] is not None and source is not None else row[3], row[5:8])
+            yield (entity, knowledge)
+
+    def __iter_source_rows(self, db: sqlite3.Connection, source: Optional[str], rank: int,
+                           after_entity: Optional[str], batch_size: int) -> Iterator[tuple]:
+    #===================================================================================
+        while True:
+            after = '' if after_entity is None else 'and k.entity > ?'
+            after_params = () if after_entity is None else (after_entity, )
+            rows = db.execute(f'''select k.entity, ?, {INHERITED_KNOWLEDGE}, k.source, b.knowledge,
+                                        k.label, k.long_label, k.type
+                from knowledge as k join knowledge_blobs as b on b.hash=k.hash
+                where k.source is ? {after} order by k.entity limit ?''',
+                                            (rank, source) + after_params + (batch_size, )).fetchall()
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            after_entity = rows[-1][0]
 
     def __clean_source_suffix(self):
     #===============================
         assert self.db is not None
         if self.metadata('clean-source-suffix') is None:
-            self.__clean_table('knowledge', ('source', 'entity',  'knowledge'))
-            self.__clean_table('connectivity_nodes', ('source', 'node',  'path'))
-            self.set_metadata('clean-source-suffix', '1')
-            self.db.commit()
+            with self.write_lock:
+                self.__clean_table('knowledge', ('source', 'entity', ', '.join(KNOWLEDGE_VALUE_COLUMNS + ['fetched_at'])))
+                self.__clean_table('connectivity_nodes', ('source', 'node',  'path'))
+                self.set_metadata('clean-source-suffix', '1')
+                self.db.commit()
 
     def __clean_table(self, table: str, columns: tuple[str, str, str]):
     #==================================================================
@@ -541,7 +1864,7 @@ class KnowledgeStore(KnowledgeBase):
         for source in sources:
             cleaned_source = clean_knowledge_source(source)
             if source != cleaned_source:
-                self.db.execute(f"""insert into {table} {columns[0], columns[1], columns[2]}
+                self.db.execute(f"""insert into {table} ({columns[0]}, {columns[1]}, {columns[2]})
                     select ?, {columns[1]}, {columns[2]} from {table}
                         where {columns[0]}=? and {columns[1]} not in (
                             select {columns[1]} from {table} where {columns[0]}=?)""",
@@ -0,0 +1,102 @@
+#===============================================================================
+#
+#  Flatmap viewer and annotation tools
+#
+#  Copyright (c) 2019-24  David Brooks
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#===============================================================================
+
+from __future__ import annotations
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from . import KnowledgeStore
+    from .encoding import Knowledge
+
+#===============================================================================
+
+class AsyncKnowledgeStore(object):
+    """
+    An asyncio facade for a :class:`KnowledgeStore`.
+
+    Cached knowledge is returned directly, local database reads are run in one
+    thread pool and lookups that need to consult SCKAN are run in another, so
+    that slow SCKAN lookups never hold up either the event loop or local reads.
+
+    :param store:           A knowledge store, which must have been opened with
+                            ``concurrent=True`` if it has a local database
+    :param max_workers:     The maximum number of threads for local database reads
+    :param sckan_workers:   The maximum number of threads for SCKAN lookups
+    """
+    def __init__(self, store: KnowledgeStore, max_workers: Optional[int]=None, sckan_workers: Optional[int]=None):
+        if store.db is not None and not store.concurrent:
+            raise ValueError('An asynchronous knowledge store requires a store opened with `concurrent=True`')
+        self.__store = store
+        self.__local_executor = ThreadPoolExecutor(max_workers, thread_name_prefix='knowledge-local')
+        self.__sckan_executor = ThreadPoolExecutor(sckan_workers, thread_name_prefix='knowledge-sckan')
+
+    @property
+    def store(self) -> KnowledgeStore:
+        return self.__store
+
+    async def __local(self, func, *args):
+    #====================================
+        return await asyncio.get_running_loop().run_in_executor(self.__local_executor, func, *args)
+
+    async def __sckan(self, func, *args):
+    #====================================
+        return await asyncio.get_running_loop().run_in_executor(self.__sckan_executor, func, *args)
+
+    def close(self):
+    #===============
+        self.__local_executor.shutdown(wait=True, cancel_futures=True)
+        self.__sckan_executor.shutdown(wait=True, cancel_futures=True)
+        self.__store.close()
+
+    async def entity_knowledge(self, entity: str, source: Optional[str]=None) -> Knowledge:
+    #======================================================================================
+        # Checking the cache's generation reads the database
+        if self.__store.generation_check_due:
+            await self.__local(self.__store.check_generation)
+        if (knowledge := self.__store.cached_knowledge(entity, source, check_generation=False)) is not None:
+            return knowledge
+        if (knowledge := await self.__local(self.__store.local_knowledge, entity, source)) is not None:
+            return knowledge
+        return await self.__sckan(self.__store.entity_knowledge, entity, source)
+
+    async def entity_knowledge_many(self, entities: Iterable[str], source: Optional[str]=None) -> dict[str, Knowledge]:
+    #==================================================================================================================
+        entities = list(dict.fromkeys(entities))
+        entity_knowledge = await self.__local(self.__store.local_knowledge_many, entities, source)
+        if len(unresolved := [entity for entity in entities if entity not in entity_knowledge]):
+            entity_knowledge.update(await self.__sckan(self.__store.entity_knowledge_many, unresolved, source))
+        return entity_knowledge
+
+    async def knowledge_sources(self) -> list[str]:
+    #==============================================
+        return await self.__local(self.__store.knowledge_sources)
+
+    async def label(self, entity: str) -> str:
+    #=========================================
+        knowledge = await self.entity_knowledge(entity)
+        return knowledge.get('label') or knowledge['id']
+
+    async def stored_knowledge(self, source: Optional[str]=None) -> list[Knowledge]:
+    #===============================================================================
+        return await self.__local(self.__store.stored_knowledge, source)
+
+#===============================================================================
@@ -0,0 +1,266 @@
+#===============================================================================
+#
+#  Flatmap viewer and annotation tools
+#
+#  Copyright (c) 2019-24  David Brooks
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#===============================================================================
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict, defaultdict
+import threading
+from typing import Any, Hashable, Optional
+
+#===============================================================================
+
+LRU_POLICY = 'lru'
+LFU_POLICY = 'lfu'
+
+#===============================================================================
+
+class KnowledgeCache(ABC):
+    """
+    An in-process cache of entity knowledge with hit, miss and eviction counters.
+
+    :param max_size:    The maximum number of entries to hold. The cache is
+                        unbounded if ``None``.
+    """
+    def __init__(self, max_size: Optional[int]=None):
+        if max_size is not None and max_size < 1:
+            raise ValueError(f'Invalid knowledge cache size: {max_size}')
+        self.__max_size = max_size
+        self._lock = threading.RLock()
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return self._contains(key)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._size()
+
+    @property
+    def max_size(self) -> Optional[int]:
+        return self.__max_size
+
+    @property
+    def stats(self) -> dict[str, Any]:
+    #=================================
+        with self._lock:
+            return {
+                'hits': self.__hits,
+                'misses': self.__misses,
+                'evictions': self.__evictions,
+                'size': self._size(),
+                'max-size': self.__max_size
+            }
+
+    def add(self, key: Hashable, value: Any) -> bool:
+    #================================================
+        """
+        Add an entry, without counting it as use, if it's not already cached
+        and the cache isn't full.
+
+        :returns:   ``False`` if the cache is full
+        """
+        with self._lock:
+            if not self._contains(key):
+                if self.__max_size is not None and self._size() >= self.__max_size:
+                    return False
+                self._put(key, value)
+            return True
+
+    def clear(self):
+    #===============
+        with self._lock:
+            self._clear()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+    #=============================================
+        with self._lock:
+            value = self._get(key)
+            if value is None:
+                self.__misses += 1
+            else:
+                self.__hits += 1
+            return value
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+    #=============================================
+        with self._lock:
+            return self._pop(key)
+
+    def put(self, key: Hashable, value: Any):
+    #========================================
+        with self._lock:
+            if self.__max_size is not None and not self._contains(key):
+                while self._size() >= self.__max_size:
+                    self._evict()
+                    self.__evictions += 1
+            self._put(key, value)
+
+    def reset_stats(self):
+    #=====================
+        with self._lock:
+            self.__hits = 0
+            self.__misses = 0
+            self.__evictions = 0
+
+    # Implemented by eviction policies, called with the cache's lock held
+
+    @abstractmethod
+    def _clear(self):
+        ...
+
+    @abstractmethod
+    def _contains(self, key: Hashable) -> bool:
+        ...
+
+    @abstractmethod
+    def _evict(self):
+        ...
+
+    @abstractmethod
+    def _get(self, key: Hashable) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    def _pop(self, key: Hashable) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    def _put(self, key: Hashable, value: Any):
+        ...
+
+    @abstractmethod
+    def _size(self) -> int:
+        ...
+
+#===============================================================================
+
+class LRUCache(KnowledgeCache):
+    """
+    Evict the least recently used entry when the cache is full.
+    """
+    def __init__(self, max_size: Optional[int]=None):
+        super().__init__(max_size)
+        self.__entries: OrderedDict[Hashable, Any] = OrderedDict()
+
+    def _clear(self):
+        self.__entries.clear()
+
+    def _contains(self, key: Hashable) -> bool:
+        return key in self.__entries
+
+    def _evict(self):
+        self.__entries.popitem(last=False)
+
+    def _get(self, key: Hashable) -> Optional[Any]:
+        if (value := self.__entries.get(key)) is not None:
+            self.__entries.move_to_end(key)
+        return value
+
+    def _pop(self, key: Hashable) -> Optional[Any]:
+        return self.__entries.pop(key, None)
+
+    def _put(self, key: Hashable, value: Any):
+        self.__entries[key] = value
+        self.__entries.move_to_end(key)
+
+    def _size(self) -> int:
+        return len(self.__entries)
+
+#===============================================================================
+
+class LFUCache(KnowledgeCache):
+    """
+    Evict the least frequently used entry when the cache is full, with the
+    least recently used entry evicted from amongst equally used ones.
+    """
+    def __init__(self, max_size: Optional[int]=None):
+        super().__init__(max_size)
+        self.__entries: dict[Hashable, tuple[Any, int]] = {}
+        self.__frequencies: defaultdict[int, OrderedDict[Hashable, None]] = defaultdict(OrderedDict)
+        self.__min_frequency = 0
+
+    def __touch(self, key: Hashable, value: Any, frequency: int):
+    #============================================================
+        if frequency:
+            keys = self.__frequencies[frequency]
+            del keys[key]
+            if len(keys) == 0:
+                del self.__frequencies[frequency]
+                if self.__min_frequency == frequency:
+                    self.__min_frequency = frequency + 1
+        self.__entries[key] = (value, frequency + 1)
+        self.__frequencies[frequency + 1][key] = None
+
+    def _clear(self):
+        self.__entries.clear()
+        self.__frequencies.clear()
+        self.__min_frequency = 0
+
+    def _contains(self, key: Hashable) -> bool:
+        return key in self.__entries
+
+    def _evict(self):
+        keys = self.__frequencies[self.__min_frequency]
+        key, _ = keys.popitem(last=False)
+        if len(keys) == 0:
+            del self.__frequencies[self.__min_frequency]
+        del self.__entries[key]
+        self.__min_frequency = min(self.__frequencies, default=0)
+
+    def _get(self, key: Hashable) -> Optional[Any]:
+        if (entry := self.__entries.get(key)) is not None:
+            self.__touch(key, entry[0], entry[1])
+            return entry[0]
+
+    def _pop(self, key: Hashable) -> Optional[Any]:
+        if (entry := self.__entries.pop(key, None)) is not None:
+            keys = self.__frequencies[entry[1]]
+            del keys[key]
+            if len(keys) == 0:
+                del self.__frequencies[entry[1]]
+                self.__min_frequency = min(self.__frequencies, default=0)
+            return entry[0]
+
+    def _put(self, key: Hashable, value: Any):
+        if (entry := self.__entries.get(key)) is not None:
+            self.__touch(key, value, entry[1])
+        else:
+            self.__touch(key, value, 0)
+            self.__min_frequency = 1
+
+    def _size(self) -> int:
+        return len(self.__entries)
+
+#===============================================================================
+
+CACHE_POLICIES = {
+    LRU_POLICY: LRUCache,
+    LFU_POLICY: LFUCache,
+}
+
+def knowledge_cache(policy: str=LRU_POLICY, max_size: Optional[int]=None) -> KnowledgeCache:
+#===========================================================================================
+    if (cache_class := CACHE_POLICIES.get(policy)) is None:
+        raise ValueError(f'Unknown knowledge cache policy: `{policy}`')
+    return cache_class(max_size)
+
+#===============================================================================
@@ -0,0 +1,199 @@
+#===============================================================================
+#
+#  Flatmap viewer and annotation tools
+#
+#  Copyright (c) 2019-24  David Brooks
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#===============================================================================
+
+import hashlib
+import json
+import zlib
+from collections.abc import MutableMapping
+from typing import Any, Iterator, Optional
+
+#===============================================================================
+
+# Knowledge as returned by a knowledge store, which is a ``LazyKnowledge``
+# record when the store was opened with ``lazy_knowledge=True``
+type Knowledge = MutableMapping[str, Any]
+
+#===============================================================================
+
+# Knowledge is stored in the ``knowledge`` table either as JSON text or, when
+# it's smaller, as zlib compressed JSON. Compression uses a preset dictionary
+# of strings that are common in SCKAN knowledge, with the first byte of the
+# compressed value identifying the dictionary so that it can be revised without
+# invalidating existing stores.
+
+ZLIB_DICTIONARY_V1 = b'\x01'
+
+ZLIB_DICTIONARIES = {
+    ZLIB_DICTIONARY_V1: (
+        b'"alert": "biologicalSex": "PATO:0000383", "PATO:0000384", '
+        b'"references": ["http://www.ncbi.nlm.nih.gov/pubmed/", "https://doi.org/10.", '
+        b'"phenotypes": ["ilxtr:SensoryPhenotype", "ilxtr:SympatheticPhenotype", '
+        b'"ilxtr:ParasympatheticPhenotype", "ilxtr:IntestinoFugalProjectionPhenotype", '
+        b'"taxons": ["NCBITaxon:9606", "NCBITaxon:10116", "NCBITaxon:10090", "NCBITaxon:9615", "NCBITaxon:9825", '
+        b'"node-phenotypes": {"ilxtr:hasSomaLocatedIn": [], "ilxtr:hasAxonPresynapticElementIn": [], '
+        b'"ilxtr:hasAxonSensorySubcellularElementIn": [], "ilxtr:hasAxonLeadingToSensorySubcellularElementIn": [], '
+        b'"ilxtr:hasAxonLocatedIn": [], "ilxtr:hasDendriteLocatedIn": []}, '
+        b'"pathDisconnected": false, "pathDisconnected": true, "forward-connections": [], "axon-locations": [], '
+        b'"afferent-terminals": [], "axon-terminals": [], "somas": [["UBERON:00", []], '
+        b'"axons": [["UBERON:00", []], "dendrites": [], "nerves": [], '
+        b'"connectivity": [[["UBERON:00", []], ["UBERON:00", ["UBERON:00"]]], [["ILX:07", []], ["ILX:07", []]], '
+        b'"long-label": "neuron type ", "type": "UBERON:0001021", '
+        b'{"id": "ilxtr:neuron-type-", {"id": "ILX:07", {"id": "UBERON:00", "label": "", "source": "sckan-20'
+    ),
+}
+
+CURRENT_ZLIB_DICTIONARY = ZLIB_DICTIONARY_V1
+
+#===============================================================================
+
+def encode_knowledge(knowledge: dict) -> bytes|str:
+#==================================================
+    """
+    Encode knowledge for saving in the ``knowledge`` table.
+
+    :returns:   Compressed JSON, or JSON text if compression doesn't reduce its size
+    """
+    text = json.dumps(knowledge)
+    compressor = zlib.compressobj(level=9, zdict=ZLIB_DICTIONARIES[CURRENT_ZLIB_DICTIONARY])
+    compressed = CURRENT_ZLIB_DICTIONARY + compressor.compress(text.encode()) + compressor.flush()
+    return compressed if len(compressed) < len(text) else text
+
+def knowledge_hash(knowledge: Knowledge) -> str:
+#===============================================
+    """
+    A hash of knowledge's content, ignoring its ``source``, so that knowledge
+    about an entity can be compared across sources.
+    """
+    content = {key: value for key, value in knowledge.items() if key != 'source'}
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+def knowledge_blob(knowledge: Knowledge) -> tuple[str, bytes|str]:
+#=================================================================
+    """
+    Encode knowledge, without its ``source``, for saving in the ``knowledge_blobs`` table.
+
+    :returns:   The knowledge's hash along with its encoding
+    """
+    content = {key: value for key, value in knowledge.items() if key != 'source'}
+    return (knowledge_hash(content), encode_knowledge(content))
+
+def knowledge_etag(hash: str, source: Optional[str]) -> str:
+#===========================================================
+    """
+    An HTTP entity tag for knowledge with a given hash, from a source.
+    """
+    return hashlib.sha256(f'{hash}\n{source}'.encode()).hexdigest()
+
+def knowledge_text(value: bytes|str) -> str:
+#===========================================
+    """
+    Get the JSON text of knowledge saved in the ``knowledge`` table.
+    """
+    if isinstance(value, bytes):
+        if (zdict := ZLIB_DICTIONARIES.get(value[:1])) is None:
+            raise ValueError(f'Unknown knowledge compression dictionary: {value[:1]!r}')
+        decompressor = zlib.decompressobj(zdict=zdict)
+        value = (decompressor.decompress(value[1:]) + decompressor.flush()).decode()
+    return value
+
+def knowledge_json(value: bytes|str, source: Optional[str]) -> str:
+#==================================================================
+    """
+    Get the JSON text of knowledge saved in the ``knowledge`` table, with
+    its ``source``, which may be ``null``, added as the last key.
+    """
+    value = knowledge_text(value)
+    # Knowledge is encoded by ``json.dumps()`` so is a ``}`` terminated object
+    separator = ', ' if value != '{}' else ''
+    return f'{value[:-1]}{separator}"source": {json.dumps(source)}}}'
+
+def decode_knowledge(value: bytes|str) -> dict:
+#==============================================
+    """
+    Decode knowledge saved in the ``knowledge`` table.
+    """
+    return json.loads(knowledge_text(value))
+
+#===============================================================================
+
+class LazyKnowledge(MutableMapping):
+    """
+    Knowledge saved in the ``knowledge`` table that is only decoded when a
+    key, other than one whose value is already known, is used.
+
+    Being a mapping rather than a ``dict``, it must be converted, using
+    ``dict()``, before being serialised with ``json.dumps()``.
+
+    :param value:   The encoded knowledge
+    :param known:   Keys and values that are known without decoding the knowledge,
+                    and which take precedence over those in it
+    """
+    def __init__(self, value: bytes|str, known: dict[str, Any]):
+        self.__value = value
+        self.__known = known
+        self.__knowledge: Optional[dict] = None
+
+    def __bool__(self) -> bool:
+        if self.__knowledge is None and len(self.__known):
+            return True
+        return len(self.__decoded()) > 0
+
+    def __contains__(self, key: object) -> bool:
+        if self.__knowledge is None and key in self.__known:
+            return True
+        return key in self.__decoded()
+
+    def __delitem__(self, key: str):
+        del self.__decoded()[key]
+
+    def __getitem__(self, key: str) -> Any:
+        if self.__knowledge is None and key in self.__known:
+            return self.__known[key]
+        return self.__decoded()[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.__decoded())
+
+    def __len__(self) -> int:
+        return len(self.__decoded())
+
+    def __repr__(self) -> str:
+        return repr(self.__decoded())
+
+    def __setitem__(self, key: str, value: Any):
+        if self.__knowledge is None:
+            self.__known[key] = value
+        else:
+            self.__knowledge[key] = value
+
+    @property
+    def decoded(self) -> bool:
+    #=========================
+        return self.__knowledge is not None
+
+    def __decoded(self) -> dict:
+    #===========================
+        if (knowledge := self.__knowledge) is None:
+            knowledge = decode_knowledge(self.__value)
+            knowledge.update(self.__known)
+            self.__knowledge = knowledge
+        return knowledge
+
+#===============================================================================
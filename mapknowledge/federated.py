@@ -0,0 +1,155 @@
+#===============================================================================
+#
+#  Flatmap viewer and annotation tools
+#
+#  Copyright (c) 2019-24  David Brooks
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#===============================================================================
+
+from __future__ import annotations
+import os
+from pathlib import Path
+import threading
+from typing import Any, Iterable, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from . import KnowledgeStore
+    from .encoding import Knowledge
+
+#===============================================================================
+
+# Per-source knowledge bases are named after their source
+KNOWLEDGE_BASE_SUFFIX = '.db'
+
+#===============================================================================
+
+class FederatedKnowledgeStore(object):
+    """
+    Read-only knowledge held in a directory of knowledge bases, one per
+    knowledge source and named ``<source>.db``, as written by
+    :meth:`KnowledgeStore.export_source`.
+
+    Each source's knowledge base is opened when it's first used, so a source
+    is added or dropped by adding or removing its file.
+
+    :param store_directory: The directory containing the knowledge bases
+    :param store_options:   Options, such as ``concurrent``, ``immutable`` and
+                            ``cache_size``, for each source's :class:`KnowledgeStore`
+    """
+    def __init__(self, store_directory, **store_options: Any):
+        self.__store_directory = Path(store_directory)
+        if not self.__store_directory.is_dir():
+            raise IOError(f'Missing federated knowledge store: {self.__store_directory}')
+        self.__store_options = {'verbose': False, **store_options}
+        self.__stores: dict[str, KnowledgeStore] = {}
+        self.__lock = threading.Lock()
+
+    @property
+    def source(self) -> Optional[str]:
+    #=================================
+        """
+        The most recent knowledge source.
+        """
+        sources = self.knowledge_sources()
+        return sources[0] if len(sources) else None
+
+    def close(self):
+    #===============
+        with self.__lock:
+            for store in self.__stores.values():
+                store.close()
+            self.__stores = {}
+
+    def drop_source(self, source: str):
+    #==================================
+        """
+        Close a knowledge source's store and delete its knowledge base.
+        """
+        from . import clean_knowledge_source
+        source = clean_knowledge_source(source)
+        if source not in self.knowledge_sources():
+            raise ValueError(f'Unknown knowledge source: `{source}`')
+        with self.__lock:
+            if (store := self.__stores.pop(source, None)) is not None:
+                store.close()
+            knowledge_base = self.__store_directory / f'{source}{KNOWLEDGE_BASE_SUFFIX}'
+            for suffix in ['', '-wal', '-shm']:
+                if (path := Path(f'{knowledge_base}{suffix}')).exists():
+                    os.remove(path)
+
+    def knowledge_sources(self) -> list[str]:
+    #========================================
+        from . import KNOWLEDGE_BASE
+        return sorted([path.stem for path in self.__store_directory.glob(f'*{KNOWLEDGE_BASE_SUFFIX}')
+                            if path.name != KNOWLEDGE_BASE], reverse=True)
+
+    def store(self, source: Optional[str]=None) -> KnowledgeStore:
+    #=============================================================
+        """
+        The knowledge store of a source, opening it if necessary.
+
+        :param source:  The knowledge source; defaults to the most recent source
+        """
+        from . import KnowledgeStore, clean_knowledge_source
+        if source is None:
+            if (source := self.source) is None:
+                raise ValueError(f'No knowledge sources in {self.__store_directory}')
+        else:
+            source = clean_knowledge_source(source)
+        with self.__lock:
+            if (store := self.__stores.get(source)) is None:
+                knowledge_base = f'{source}{KNOWLEDGE_BASE_SUFFIX}'
+                if not (self.__store_directory / knowledge_base).exists():
+                    raise ValueError(f'Unknown knowledge source: `{source}`')
+                store = KnowledgeStore(self.__store_directory, knowledge_base=knowledge_base,
+                                       create=False, read_only=True, knowledge_source=source,
+                                       use_sckan=False, **self.__store_options)
+                self.__stores[source] = store
+            return store
+
+    def entity_knowledge(self, entity: str, source: Optional[str]=None) -> Knowledge:
+    #================================================================================
+        return self.store(source).entity_knowledge(entity)
+
+    def entity_knowledge_json(self, entity: str, source: Optional[str]=None) -> tuple[str, str]:
+    #===========================================================================================
+        return self.store(source).entity_knowledge_json(entity)
+
+    def entity_knowledge_many(self, entities: Iterable[str], source: Optional[str]=None) -> dict[str, Knowledge]:
+    #============================================================================================================
+        return self.store(source).entity_knowledge_many(entities)
+
+    def label(self, entity: str, source: Optional[str]=None) -> str:
+    #===============================================================
+        knowledge = self.entity_knowledge(entity, source)
+        return knowledge.get('label') or knowledge['id']
+
+    def labels(self, source: Optional[str]=None) -> list[tuple[str, str]]:
+    #=====================================================================
+        return self.store(source).labels()
+
+    def paths_through(self, term: str, source: Optional[str]=None) -> list[str]:
+    #===========================================================================
+        return self.store(source).paths_through(term)
+
+    def search_labels(self, query: str, limit: int=20, source: Optional[str]=None) -> list[tuple[str, str]]:
+    #=======================================================================================================
+        return self.store(source).search_labels(query, limit)
+
+    def stored_knowledge(self, source: Optional[str]=None) -> list[Knowledge]:
+    #=========================================================================
+        return self.store(source).stored_knowledge()
+
+#===============================================================================
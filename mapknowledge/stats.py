@@ -0,0 +1,109 @@
+#===============================================================================
+#
+#  Flatmap viewer and annotation tools
+#
+#  Copyright (c) 2019-24  David Brooks
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#===============================================================================
+
+from bisect import bisect_left
+import threading
+import time
+from typing import Any
+
+#===============================================================================
+
+# Where a knowledge store spends its time
+
+CACHE_TIER = 'cache'
+SQLITE_TIER = 'sqlite'
+NPO_TIER = 'npo'
+SCICRUNCH_TIER = 'scicrunch'
+WRITE_TIER = 'write'
+
+KNOWLEDGE_TIERS = [CACHE_TIER, SQLITE_TIER, NPO_TIER, SCICRUNCH_TIER, WRITE_TIER]
+
+# Upper bounds, in seconds, of latency histogram buckets. The last bucket
+# counts everything slower.
+LATENCY_BUCKETS = [0.00001, 0.0001, 0.001, 0.01, 0.1, 1.0, 10.0]
+
+#===============================================================================
+
+class KnowledgeTimer(object):
+    def __init__(self, stats: 'KnowledgeStats', tier: str):
+        self.__stats = stats
+        self.__tier = tier
+        self.__start = 0.0
+
+    def __enter__(self):
+        self.__start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.__stats.record(self.__tier, time.perf_counter() - self.__start)
+
+#===============================================================================
+
+class KnowledgeStats(object):
+    """
+    Counts and latency histograms of the operations in each tier of a
+    knowledge store.
+    """
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__tiers: dict[str, tuple[list[int], list[float]]] = {}
+        self.reset()
+
+    def record(self, tier: str, elapsed: float):
+    #===========================================
+        bucket = bisect_left(LATENCY_BUCKETS, elapsed)
+        with self.__lock:
+            (counts, times) = self.__tiers[tier]
+            counts[bucket] += 1
+            times[0] += elapsed
+            if elapsed > times[1]:
+                times[1] = elapsed
+
+    def reset(self):
+    #===============
+        with self.__lock:
+            self.__tiers = {tier: ([0]*(len(LATENCY_BUCKETS) + 1), [0.0, 0.0])
+                                for tier in KNOWLEDGE_TIERS}
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+    #===============================================
+        """
+        The number of operations in each tier, their ``total`` and ``max`` time
+        in seconds, and a ``histogram`` of counts keyed by each bucket's upper
+        bound in seconds, with ``inf`` for the slowest.
+        """
+        with self.__lock:
+            return {
+                tier: {
+                    'count': sum(counts),
+                    'total': times[0],
+                    'max': times[1],
+                    'histogram': dict(zip([str(bound) for bound in LATENCY_BUCKETS] + ['inf'], counts))
+                } for tier, (counts, times) in self.__tiers.items()
+            }
+
+    def timed(self, tier: str) -> KnowledgeTimer:
+    #============================================
+        """
+        A context manager that records the time taken by an operation.
+        """
+        return KnowledgeTimer(self, tier)
+
+#===============================================================================
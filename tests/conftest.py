@@ -1,6 +1,33 @@
+import copy
+import time
+
 import pytest
+
+import mapknowledge
 from mapknowledge import KnowledgeStore
 
+STUB_SCKAN_RELEASE = 'sckan-2024-09-21'
+
+class StubSckan:
+    """
+    Stands in for NPO, returning knowledge from ``knowledge`` and recording
+    each lookup in ``lookups``, with lookups taking ``delay`` seconds.
+    """
+    def __init__(self):
+        self.knowledge = {}
+        self.lookups = []
+        self.release = STUB_SCKAN_RELEASE
+        self.terms = []
+        self.delay = 0
+
+    def build(self):
+        return {}
+
+    def get_knowledge(self, entity):
+        self.lookups.append(entity)
+        time.sleep(self.delay)
+        return copy.deepcopy(self.knowledge.get(entity, {'id': entity}))
+
 def pytest_addoption(parser):
     parser.addoption(
         "--sckan-version",
@@ -15,3 +42,16 @@ def store(request):
     ks = KnowledgeStore(sckan_version=sckan_version)
     yield ks
     ks.close()
+
+@pytest.fixture
+def local_store(tmp_path):
+    ks = KnowledgeStore(store_directory=tmp_path, use_sckan=False, verbose=False)
+    yield ks
+    ks.close()
+
+@pytest.fixture
+def sckan(monkeypatch):
+    stub = StubSckan()
+    monkeypatch.setattr(mapknowledge, 'Npo', lambda sckan_version: stub)
+    monkeypatch.setattr(mapknowledge, 'SciCrunch', lambda **kwds: None)
+    return stub
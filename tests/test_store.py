@@ -0,0 +1,488 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from mapknowledge import AsyncKnowledgeStore, FederatedKnowledgeStore, KnowledgeCache, KnowledgeStore, LazyKnowledge, LFUCache, SCHEMA_VERSION
+from mapknowledge import decode_knowledge, encode_knowledge, NERVE_TYPE
+
+
+SOURCE = 'sckan-2024-09-21'
+
+def add_knowledge(store, entity, knowledge, source=SOURCE):
+    store.save_knowledge(entity, knowledge, source=source)
+    store.db.commit()
+
+def test_entity_knowledge_many(local_store):
+    add_knowledge(local_store, 'UBERON:0001', {'id': 'UBERON:0001', 'label': 'heart'})
+    add_knowledge(local_store, 'UBERON:0002', {'id': 'UBERON:0002', 'label': 'lung'})
+    knowledge = local_store.entity_knowledge_many(['UBERON:0001', 'UBERON:0002', 'UBERON:0003', 'UBERON:0001'])
+    assert list(knowledge.keys()) == ['UBERON:0001', 'UBERON:0002', 'UBERON:0003']
+    assert knowledge['UBERON:0001']['label'] == 'heart'
+    assert knowledge['UBERON:0002']['source'] == SOURCE
+    assert knowledge['UBERON:0003']['label'] == 'UBERON:0003'
+    assert local_store.entity_knowledge('UBERON:0002', source=SOURCE) is knowledge['UBERON:0002']
+
+def test_bounded_cache(tmp_path):
+    store = KnowledgeStore(store_directory=tmp_path, use_sckan=False, verbose=False, cache_size=2)
+    for n in range(3):
+        add_knowledge(store, f'UBERON:000{n}', {'id': f'UBERON:000{n}', 'label': f'term {n}'})
+    for n in range(3):
+        store.entity_knowledge(f'UBERON:000{n}', source=SOURCE)
+    store.entity_knowledge('UBERON:0002', source=SOURCE)
+    stats = store.cache_stats
+    assert (stats['hits'], stats['misses'], stats['evictions'], stats['size']) == (1, 3, 1, 2)
+    store.close()
+
+def test_lfu_cache():
+    cache = LFUCache(2)
+    cache.put('a', {})
+    cache.put('b', {})
+    cache.get('a')
+    cache.put('c', {})
+    assert 'a' in cache and 'c' in cache and 'b' not in cache
+
+def test_incomplete_cache_policy():
+    class NoEvictionCache(KnowledgeCache):
+        def _clear(self): pass
+        def _contains(self, key): return False
+        def _get(self, key): return None
+        def _pop(self, key): return None
+        def _put(self, key, value): pass
+        def _size(self): return 0
+    with pytest.raises(TypeError):
+        NoEvictionCache(2)
+
+def test_concurrent_reads(tmp_path):
+    store = KnowledgeStore(store_directory=tmp_path, use_sckan=False, verbose=False, concurrent=True)
+    entities = [f'UBERON:{n:04}' for n in range(100)]
+    for entity in entities:
+        add_knowledge(store, entity, {'id': entity, 'label': entity.lower()})
+    assert store.db.execute('pragma journal_mode').fetchone()[0] == 'wal'
+    def lookup(entity):
+        return store.entity_knowledge(entity, source=SOURCE)['label']
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        labels = list(executor.map(lookup, entities))
+    assert labels == [entity.lower() for entity in entities]
+    store.close()
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self/fd'), reason='Needs /proc to count open files')
+def test_thread_read_connections_closed(tmp_path):
+    store = KnowledgeStore(store_directory=tmp_path, use_sckan=False, verbose=False, concurrent=True)
+    add_knowledge(store, 'UBERON:0001', {'id': 'UBERON:0001', 'label': 'heart'})
+    def read_in_thread():
+        thread = threading.Thread(target=store.entity_knowledge_many, args=(['UBERON:0001'], SOURCE))
+        thread.start()
+        thread.join()
+    read_in_thread()
+    open_files = len(os.listdir('/proc/self/fd'))
+    for _ in range(20):
+        read_in_thread()
+    assert len(os.listdir('/proc/self/fd')) == open_files
+    store.close()
+
+def test_async_store(tmp_path):
+    store = KnowledgeStore(store_directory=tmp_path, use_sckan=False, verbose=False, concurrent=True)
+    add_knowledge(store, 'UBERON:0001', {'id': 'UBERON:0001', 'label': 'heart'})
+    async_store = AsyncKnowledgeStore(store)
+    async def lookup():
+        return await asyncio.gather(async_store.entity_knowledge('UBERON:0001', source=SOURCE),
+                                    async_store.entity_knowledge_many(['UBERON:0001', 'UBERON:0002'], source=SOURCE))
+    (knowledge, many) = asyncio.run(lookup())
+    assert knowledge['label'] == 'heart'
+    assert many['UBERON:0001']['label'] == 'heart'
+    assert many['UBERON:0002']['label'] == 'UBERON:0002'
+    async_store.close()
+
+def test_coalesced_lookups(tmp_path, sckan):
+    sckan.knowledge['UBERON:0001'] = {'id': 'UBERON:0001', 'label': 'heart'}
+    sckan.delay = 0.2
+    store = KnowledgeStore(store_directory=tmp_path, verbose=False, concurrent=True)
+    barrier = threading.Barrier(8)
+    def lookup(_):
+        barrier.wait()
+        return store.entity_knowledge('UBERON:0001')
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        knowledge = list(executor.map(lookup, range(8)))
+    assert all(k['label'] == 'heart' for k in knowledge)
+    assert sckan.lookups == ['UBERON:0001']
+    store.close()
+
+def test_compressed_knowledge(local_store):
+    path = {'id': 'ilxtr:neuron-type-test-1', 'label': 'neuron type test 1',
+            'connectivity': [[['UBERON:0002349', ['UBERON:0002084']], ['UBERON:0002165', []]]],
+            'node-phenotypes': {'ilxtr:hasSomaLocatedIn': [], 'ilxtr:hasAxonLocatedIn': []}}
+    encoded = encode_knowledge(path)
+    assert isinstance(encoded, bytes) and len(encoded) < len(json.dumps(path))
+    assert decode_knowledge(encoded) == path
+    add_knowledge(local_store, path['id'], path)
+    assert isinstance(local_store.db.execute('select knowledge from knowledge_blobs').fetchone()[0], bytes)
+    assert local_store.entity_knowledge(path['id'], source=SOURCE)['connectivity'] == path['connectivity']
+
+def test_entity_knowledge_json(local_store):
+    new_source = 'sckan-2025-01-01'
+    add_knowledge(local_store, 'UBERON:0001', {'id': 'UBERON:0001', 'label': 'heart', 'synonyms': ['cor']})
+    add_knowledge(local_store, 'UBERON:0001', {'id': 'UBERON:0001', 'label': 'heart', 'synonyms': ['cor']},
+                  source=new_source)
+    add_knowledge(local_store, 'UBERON:0002', {'id': 'UBERON:0002'})
+    (text, etag) = local_store.entity_knowledge_json('UBERON:0001', SOURCE)
+    assert text == json.dumps(local_store.entity_knowledge('UBERON:0001', SOURCE))
+    assert local_store.entity_knowledge_json('UBERON:0001', SOURCE)[1] == etag
+    assert local_store.entity_knowledge_json('UBERON:0001', new_source)[1] != etag
+    (text, etag) = local_store.entity_knowledge_json('UBERON:0002', SOURCE)
+    assert json.loads(text) == {'id': 'UBERON:0002', 'label': 'UBERON:0002', 'source': SOURCE}
+
+def test_entity_knowledge_json_without_source(tmp_path):
+    store = KnowledgeStore(store_directory=tmp_path, use_sckan=False, verbose=False)
+    add_knowledge(store, 'UBERON:0001', {'id': 'UBERON:0001', 'label': 'heart'}, source=None)
+    (text, etag) = store.entity_knowledge_json('UBERON:0001')
+    assert text == json.dumps(store.entity_knowledge('UBERON:0001'))
+    assert json.loads(text) == {'id': 'UBERON:0001', 'label': 'heart', 'source': None}
+    store.close()
+
+def test_lazy_knowledge(tmp_path):
+    store = KnowledgeStore(store_directory=tmp_path, use_sckan=False, verbose=False)
+    path_knowledge = {'id': 'ilxtr:neuron-type-test-1', 'label': 'path', 'type': 'ilxtr:NeuronTypeTest',
+                      'connectivity': [[['UBERON:0001', []], ['UBERON:0002', []]]]}
+    add_knowledge(store, 'ilxtr:neuron-type-test-1', path_knowledge)
+    store.close()
+    store = KnowledgeStore(store_directory=tmp_path, use_sckan=False, verbose=False, lazy_knowledge=True)
+    knowledge = store.entity_knowledge('ilxtr:neuron-type-test-1')
+    assert isinstance(knowledge, LazyKnowledge)
+    assert (knowledge['label'], knowledge['type'], knowledge['source']) == ('path', 'ilxtr:NeuronTypeTest', SOURCE)
+    assert store.label('ilxtr:neuron-type-test-1') == 'path'
+    assert not knowledge.decoded
+    assert knowledge == path_knowledge | {'source': SOURCE}
+    assert knowledge.decoded
+    assert [dict(knowledge) for knowledge in store.stored_knowledge(SOURCE)] == [path_knowledge | {'source': SOURCE}]
+    store.close()
+
+def test_shared_knowledge_blobs(local_store):
+    add_knowledge(local_store, 'UBERON:0001', {'id': 'UBERON:0001', 'label': 'heart', 'source': SOURCE})
+    add_knowledge(local_store, 'UBERON:0001', {'id': 'UBERON:0001', 'label': 'heart'}, source='sckan-2025-01-01')
+    assert local_store.db.execute('select count(*) from knowledge_blobs').fetchone()[0] == 1
+    assert local_store.entity_knowledge('UBERON:0001', 'sckan-2025-01-01')['source'] == 'sckan-2025-01-01'
+    add_knowledge(local_store, 'UBERON:0001', {'id': 'UBERON:0001', 'label': 'hearts'})
+    local_store.db.execute('delete from knowledge where source=?', ('sckan-2025-01-01', ))
+    assert [decode_knowledge(row[0]) for row in local_store.db.execute('select knowledge from knowledge_blobs')] == [
+        {'id': 'UBERON:0001', 'label': 'hearts'}]
+
+def test_schema_upgrade_compresses_knowledge(tmp_path):
+    db = sqlite3.connect(tmp_path / 'knowledgebase.db')
+    db.executescript("""
+        create table metadata (name text primary key, value text);
+        create table knowledge (source text, entity text, knowledge text);
+        create unique index knowledge_index on knowledge(source, entity);
+        create table connectivity_models (model text primary key, version text);
+        create table pmr_models (term text, score number, model text, workspace text, exposure text);
+        create table connectivity_nodes (source text, node text, path text);
+        insert into metadata (name, value) values ('schema_version', '1.4');
+    """)
+    knowledge = {'id': 'ilxtr:neuron-type-test-1', 'label': 'neuron type test 1', 'long-label': 'neuron type test 1',
+                 'dendrites': [], 'axons': [], 'somas': [], 'nerves': [], 'axon-terminals': []}
+    db.execute('insert into knowledge values (?, ?, ?)', (SOURCE, knowledge['id'], json.dumps(knowledge)))
+    db.execute('insert into connectivity_nodes values (?, ?, ?)',
+                    (SOURCE, json.dumps(['UBERON:0002', ['UBERON:0003']]), knowledge['id']))
+    db.commit()
+    db.close()
+    store = KnowledgeStore(store_directory=tmp_path, use_sckan=False, verbose=False)
+    assert store.metadata('schema_version') == SCHEMA_VERSION
+    assert isinstance(store.db.execute('select knowledge from knowledge_blobs').fetchone()[0], bytes)
+    assert store.entity_knowledge(knowledge['id'])['long-label'] == knowledge['long-label']
+    assert store.search_labels('neuron test') == [(knowledge['id'], knowledge['label'])]
+    assert store.paths_through('UBERON:0003') == [knowledge['id']]
+    assert store.db.execute("select hash from knowledge").fetchone()[0] is not None
+    assert store.source_metadata(SOURCE)['entities'] == 1
+    store.close()
+
+def test_indexed_knowledge_columns(local_store):
+    add_knowledge(local_store, 'ILX:0793221', {'id': 'ILX:0793221', 'label': 'nerve', 'type': NERVE_TYPE})
+    add_knowledge(local_store, 'UBERON:0001', {'id': 'UBERON:0001'})
+    add_knowledge(local_store, 'ilxtr:neuron-type-test-1', {'id': 'ilxtr:neuron-type-test-1', 'label': 'path',
+                  'connectivity': [[['UBERON:0001', []], ['ILX:0793221', []]]]})
+    assert local_store.labels(SOURCE) == [('ILX:0793221', 'nerve'), ('UBERON:0001', 'UBERON:0001'),
+                                          ('ilxtr:neuron-type-test-1', 'path')]
+    assert local_store.stored_entities_of_type(NERVE_TYPE, SOURCE) == ['ILX:0793221']
+    assert local_store.stored_paths(SOURCE) == ['ilxtr:neuron-type-test-1']
+
+def test_search_labels(local_store):
+    add_knowledge(local_store, 'UBERON:0002', {'id': 'UBERON:0002', 'label': 'heart'})
+    add_knowledge(local_store, 'UBERON:0003', {'id': 'UBERON:0003', 'label': 'heart valve'})
+    add_knowledge(local_store, 'ilxtr:neuron-type-test-1', {'id': 'ilxtr:neuron-type-test-1', 'label': 'neuron type test 1',
+                  'long-label': 'sympathetic neuron innervating the heart'})
+    assert local_store.search_labels('hea', source=SOURCE) == [('UBERON:0002', 'heart'), ('UBERON:0003', 'heart valve'),
+                                                               ('ilxtr:neuron-type-test-1', 'neuron type test 1')]
+    assert local_store.search_labels('heart valv', source=SOURCE) == [('UBERON:0003', 'heart valve')]
+    add_knowledge(local_store, 'UBERON:0003', {'id': 'UBERON:0003', 'label': 'mitral valve'})
+    assert local_store.search_labels('valve', source=SOURCE) == [('UBERON:0003', 'mitral valve')]
+    assert local_store.db.execute('select count(*) from knowledge_labels').fetchone()[0] == 3
+    # Knowledge without a source doesn't add duplicate results
+    add_knowledge(local_store, 'UBERON:0002', {'id': 'UBERON:0002', 'label': 'heart'}, source=None)
+    assert local_store.search_labels('hea', limit=2, source=SOURCE) == [('UBERON:0002', 'heart'),
+                                                                       ('ilxtr:neuron-type-test-1', 'neuron type test 1')]
+
+def test_paths_through(local_store):
+    add_knowledge(local_store, 'ilxtr:neuron-type-test-1', {'id': 'ilxtr:neuron-type-test-1',
+                  'connectivity': [[['UBERON:0001', []], ['UBERON:0002', ['UBERON:0003']]]]})
+    add_knowledge(local_store, 'ilxtr:neuron-type-test-2', {'id': 'ilxtr:neuron-type-test-2',
+                  'connectivity': [[['UBERON:0003', []], ['UBERON:0004', []]]]})
+    assert local_store.paths_through('UBERON:0001', SOURCE) == ['ilxtr:neuron-type-test-1']
+    assert local_store.paths_through('UBERON:0003', SOURCE) == ['ilxtr:neuron-type-test-1', 'ilxtr:neuron-type-test-2']
+    local_store.db.execute('delete from connectivity_nodes where path=?', ('ilxtr:neuron-type-test-2', ))
+    local_store.db.commit()
+    assert local_store.paths_through('UBERON:0003', SOURCE) == ['ilxtr:neuron-type-test-1']
+    assert local_store.paths_through('UBERON:0004', SOURCE) == []
+
+def test_stored_knowledge_pages(local_store):
+    entities = [f'UBERON:{n:04}' for n in range(5)]
+    for entity in entities:
+        add_knowledge(local_store, entity, {'id': entity, 'label': entity.lower()})
+        add_knowledge(local_store, entity, {'id': entity, 'label': entity.lower()}, source=None)
+    assert [kn['id'] for kn in local_store.iter_stored_knowledge(SOURCE, batch_size=2)] == entities
+    (page, after_entity) = local_store.stored_knowledge_page(limit=2, source=SOURCE)
+    assert [kn['id'] for kn in page] == entities[:2] and after_entity == entities[1]
+    (page, after_entity) = local_store.stored_knowledge_page(after_entity, limit=3, source=SOURCE)
+    assert [kn['id'] for kn in page] == entities[2:] and after_entity is None
+
+def test_clean_connectivity(local_store):
+    add_knowledge(local_store, 'ilxtr:neuron-type-test-1', {'id': 'ilxtr:neuron-type-test-1',
+                  'connectivity': [[['UBERON:0001', []], ['UBERON:0002', ['UBERON:0003']]]]})
+    for entity in ['UBERON:0001', 'UBERON:0002', 'UBERON:0003', 'UBERON:0004']:
+        add_knowledge(local_store, entity, {'id': entity, 'label': entity.lower()})
+    add_knowledge(local_store, 'UBERON:0001', {'id': 'UBERON:0001'}, source='sckan-2024-03-26')
+    local_store.clean_connectivity(SOURCE)
+    assert [row[0] for row in local_store.db.execute('select entity from knowledge order by entity')] == ['UBERON:0001', 'UBERON:0004']
+    assert local_store.db.execute('select count(*) from connectivity_nodes').fetchone()[0] == 0
+    assert local_store.paths_through('UBERON:0001', SOURCE) == []
+
+def test_diff_sources(local_store):
+    old_source = 'sckan-2024-03-26'
+    add_knowledge(local_store, 'UBERON:0001', {'id': 'UBERON:0001', 'label': 'heart', 'source': old_source}, source=old_source)
+    add_knowledge(local_store, 'UBERON:0002', {'id': 'UBERON:0002', 'label': 'lung'}, source=old_source)
+    add_knowledge(local_store, 'UBERON:0003', {'id': 'UBERON:0003', 'label': 'liver'}, source=old_source)
+    add_knowledge(local_store, 'UBERON:0001', {'id': 'UBERON:0001', 'label': 'heart', 'source': SOURCE})
+    add_knowledge(local_store, 'UBERON:0002', {'id': 'UBERON:0002', 'label': 'lungs'})
+    add_knowledge(local_store, 'UBERON:0004', {'id': 'UBERON:0004', 'label': 'kidney'})
+    assert list(local_store.diff_sources(old_source, SOURCE)) == [('UBERON:0002', 'changed'), ('UBERON:0003', 'removed'),
+                                                                  ('UBERON:0004', 'added')]
+
+def test_overlay_source(local_store):
+    new_source = 'sckan-2025-01-01'
+    add_knowledge(local_store, 'UBERON:0001', {'id': 'UBERON:0001', 'label': 'heart'})
+    add_knowledge(local_store, 'UBERON:0002', {'id': 'UBERON:0002', 'label': 'lung'})
+    add_knowledge(local_store, 'UBERON:0003', {'id': 'UBERON:0003', 'label': 'stomach'})
+    add_knowledge(local_store, 'ilxtr:neuron-type-test-1', {'id': 'ilxtr:neuron-type-test-1', 'label': 'path',
+                  'connectivity': [[['UBERON:0002', []], ['UBERON:0003', []]]]})
+    add_knowledge(local_store, 'ilxtr:removed-thing', {'id': 'ilxtr:removed-thing', 'label': 'thing'})
+    add_knowledge(local_store, 'UBERON:0001', {'id': 'UBERON:0001', 'label': 'heart'}, source='unrelated')
+    local_store.db.execute('update knowledge set fetched_at=0 where entity=?', ('UBERON:0001', ))
+    local_store.create_overlay_source(new_source, SOURCE)
+    assert local_store.source_parent(new_source) == SOURCE
+    add_knowledge(local_store, 'UBERON:0001', {'id': 'UBERON:0001', 'label': 'heart'}, source=new_source)
+    assert dict(local_store.db.execute('select source, fetched_at > 0 from knowledge where entity=?',
+                                       ('UBERON:0001', ))) == {SOURCE: 1, 'unrelated': 0}
+    add_knowledge(local_store, 'UBERON:0002', {'id': 'UBERON:0002', 'label': 'lungs'}, source=new_source)
+    assert [row[0] for row in local_store.db.execute('select entity from knowledge where source=?',
+                                                     (new_source, ))] == ['UBERON:0002']
+    assert local_store.entity_knowledge('UBERON:0001', new_source) == {'id': 'UBERON:0001', 'label': 'heart',
+                                                                       'source': new_source}
+    assert local_store.labels(new_source) == [('UBERON:0001', 'heart'), ('UBERON:0002', 'lungs')]
+    assert local_store.stored_paths(new_source) == []
+    assert list(local_store.diff_sources(SOURCE, new_source)) == [('UBERON:0002', 'changed'),
+                                                                  ('UBERON:0003', 'removed'),
+                                                                  ('ilxtr:neuron-type-test-1', 'removed'),
+                                                                  ('ilxtr:removed-thing', 'removed')]
+    with pytest.raises(ValueError):
+        local_store.create_overlay_source(new_source, SOURCE)
+
+def test_overlay_source_connectivity(local_store):
+    # Restoring connectivity into an overlay doesn't leave the parent's connectivity visible
+    new_source = 'sckan-2025-01-01'
+    for (entity, label) in [('UBERON:0001', 'heart'), ('UBERON:0009', 'spleen')]:
+        add_knowledge(local_store, entity, {'id': entity, 'label': label})
+    add_knowledge(local_store, 'ilxtr:neuron-type-a', {'id': 'ilxtr:neuron-type-a', 'label': 'path',
+                  'connectivity': [[['UBERON:0001', []], ['UBERON:0009', []]]]})
+    add_knowledge(local_store, 'ilxtr:removed-thing', {'id': 'ilxtr:removed-thing', 'label': 'thing'})
+    local_store.create_overlay_source(new_source, SOURCE)
+    local_store.clean_connectivity(new_source)
+    for (entity, label) in [('UBERON:0001', 'heart'), ('UBERON:0002', 'lung')]:
+        add_knowledge(local_store, entity, {'id': entity, 'label': label}, source=new_source)
+    add_knowledge(local_store, 'ilxtr:neuron-type-a', {'id': 'ilxtr:neuron-type-a', 'label': 'path',
+                  'connectivity': [[['UBERON:0001', []], ['UBERON:0002', []]]]}, source=new_source)
+    assert local_store.labels(new_source) == [('UBERON:0001', 'heart'), ('UBERON:0002', 'lung'),
+                                              ('ilxtr:neuron-type-a', 'path')]
+    assert list(local_store.diff_sources(SOURCE, new_source)) == [('UBERON:0002', 'added'),
+                                                                  ('UBERON:0009', 'removed'),
+                                                                  ('ilxtr:neuron-type-a', 'changed'),
+                                                                  ('ilxtr:removed-thing', 'removed')]
+    assert [knowledge['id'] for knowledge in local_store.iter_stored_knowledge(new_source)] == [
+                                    'UBERON:0001', 'UBERON:0002', 'ilxtr:neuron-type-a']
+
+def test_source_metadata(local_store):
+    add_knowledge(local_store, 'UBERON:0001', {'id': 'UBERON:0001', 'label': 'heart'})
+    add_knowledge(local_store, 'UBERON:0001', {'id': 'UBERON:0001', 'label': 'hearts'})
+    add_knowledge(local_store, 'ilxtr:neuron-type-test-1', {'id': 'ilxtr:neuron-type-test-1', 'label': 'path',
+                  'connectivity': [[['UBERON:0001', []], ['UBERON:0002', []]]]})
+    metadata = local_store.source_metadata(SOURCE)
+    assert (metadata['entities'], metadata['parent'], metadata['provenance']) == (2, None, None)
+    local_store.clean_connectivity(SOURCE)
+    assert local_store.source_metadata(SOURCE)['entities'] == 0
+    assert local_store.knowledge_sources() == []
+    assert local_store.source_metadata('sckan-2025-01-01') is None
+    # A source without knowledge can be recreated as an overlay
+    add_knowledge(local_store, 'UBERON:0001', {'id': 'UBERON:0001', 'label': 'heart'}, source='sckan-2024-01-01')
+    local_store.create_overlay_source(SOURCE, 'sckan-2024-01-01')
+    assert local_store.source_parent(SOURCE) == 'sckan-2024-01-01'
+
+def test_federated_store(local_store, tmp_path):
+    new_source = 'sckan-2025-01-01'
+    add_knowledge(local_store, 'UBERON:0001', {'id': 'UBERON:0001', 'label': 'heart'})
+    add_knowledge(local_store, 'ilxtr:neuron-type-test-1', {'id': 'ilxtr:neuron-type-test-1', 'label': 'path',
+                  'connectivity': [[['UBERON:0004', []], ['UBERON:0002', ['UBERON:0003']]]]})
+    local_store.create_overlay_source(new_source, SOURCE)
+    add_knowledge(local_store, 'UBERON:0002', {'id': 'UBERON:0002', 'label': 'lung'}, source=new_source)
+    federated_directory = tmp_path / 'federated'
+    for source in (SOURCE, new_source):
+        local_store.export_source(source, federated_directory / f'{source}.db')
+    with pytest.raises(ValueError):
+        local_store.export_source(SOURCE, federated_directory / f'{SOURCE}.db')
+    federated = FederatedKnowledgeStore(federated_directory)
+    assert federated.knowledge_sources() == [new_source, SOURCE]
+    assert federated.entity_knowledge('UBERON:0001') == {'id': 'UBERON:0001', 'label': 'heart', 'source': new_source}
+    assert federated.labels() == [('UBERON:0001', 'heart'), ('UBERON:0002', 'lung')]
+    assert federated.paths_through('UBERON:0003', SOURCE) == ['ilxtr:neuron-type-test-1']
+    assert federated.search_labels('lun') == [('UBERON:0002', 'lung')]
+    federated.drop_source(new_source)
+    assert federated.knowledge_sources() == [SOURCE]
+    assert federated.label('UBERON:0001') == 'heart'
+    federated.close()
+
+def test_immutable_store(tmp_path):
+    store = KnowledgeStore(store_directory=tmp_path, use_sckan=False, verbose=False)
+    add_knowledge(store, 'UBERON:0001', {'id': 'UBERON:0001', 'label': 'heart'})
+    store.close()
+    store = KnowledgeStore(store_directory=tmp_path, read_only=True, immutable=True, verbose=False)
+    assert store.source == SOURCE
+    assert store.entity_knowledge('UBERON:0001')['label'] == 'heart'
+    with pytest.raises(sqlite3.OperationalError):
+        store.db.execute('delete from knowledge')
+    store.close()
+
+def test_preload(tmp_path):
+    store = KnowledgeStore(store_directory=tmp_path, use_sckan=False, verbose=False)
+    entities = [f'UBERON:{n:04}' for n in range(10)]
+    for entity in entities:
+        add_knowledge(store, entity, {'id': entity, 'label': entity.lower()})
+    store.close()
+    store = KnowledgeStore(store_directory=tmp_path, use_sckan=False, verbose=False,
+                           concurrent=True, preload=True, cache_size=8)
+    assert store.wait_for_preload(10)
+    assert store.preload_progress == {'loaded': 8, 'total': 10, 'done': True}
+    store.entity_knowledge(entities[0])
+    assert store.cache_stats['hits'] + store.cache_stats['misses'] == 1
+    store.close()
+
+def test_unknown_entities(tmp_path, sckan):
+    def lookup(**options):
+        store = KnowledgeStore(store_directory=tmp_path, verbose=False, **options)
+        knowledge = store.entity_knowledge('UBERON:9999')
+        store.close()
+        return knowledge
+    assert lookup()['label'] == 'UBERON:9999'
+    assert lookup()['label'] == 'UBERON:9999'
+    assert sckan.lookups == ['UBERON:9999']
+    # SCKAN is asked again once the entity's TTL has expired
+    lookup(unknown_entity_ttl=60)
+    assert len(sckan.lookups) == 1
+    store = KnowledgeStore(store_directory=tmp_path, verbose=False)
+    store.db.execute('update unknown_entities set checked=checked-120')
+    store.db.commit()
+    store.close()
+    lookup(unknown_entity_ttl=60)
+    assert len(sckan.lookups) == 2
+    # A TTL of zero disables remembering unknown entities
+    lookup(unknown_entity_ttl=0)
+    lookup(unknown_entity_ttl=0)
+    assert len(sckan.lookups) == 4
+    store = KnowledgeStore(store_directory=tmp_path, verbose=False)
+    assert store.db.execute('select count(*) from unknown_entities').fetchone()[0] == 0
+    store.close()
+
+def test_path_saved_in_one_transaction(tmp_path, sckan):
+    path = 'ilxtr:neuron-type-test-1'
+    sckan.knowledge = {entity: {'id': entity, 'label': entity.lower()}
+                            for entity in ['UBERON:0001', 'UBERON:0002', 'UBERON:0003']}
+    sckan.knowledge[path] = {'id': path, 'label': 'test path',
+                             'connectivity': [[['UBERON:0001', []], ['UBERON:0002', ['UBERON:0003']]]]}
+    store = KnowledgeStore(store_directory=tmp_path, verbose=False)
+    statements = []
+    store.db.set_trace_callback(statements.append)
+    store.entity_knowledge(path)
+    store.db.set_trace_callback(None)
+    assert sorted(sckan.lookups) == sorted(sckan.knowledge)
+    assert len([statement for statement in statements if statement.upper().startswith('COMMIT')]) == 1
+    assert store.db.execute('select count(*) from knowledge where source=?', (SOURCE, )).fetchone()[0] == 4
+    store.close()
+
+def test_stats(local_store):
+    add_knowledge(local_store, 'UBERON:0001', {'id': 'UBERON:0001', 'label': 'heart'})
+    local_store.entity_knowledge('UBERON:0001', SOURCE)
+    local_store.entity_knowledge('UBERON:0001', SOURCE)
+    stats = local_store.stats()
+    assert stats['cache']['count'] == 2 and stats['cache']['hits'] == 1
+    assert stats['sqlite']['count'] == 1 and sum(stats['sqlite']['histogram'].values()) == 1
+    assert stats['npo']['count'] == 0
+    local_store.reset_stats()
+    assert local_store.stats()['cache']['count'] == 0 and local_store.stats()['cache']['hits'] == 0
+
+def test_refresh_stale_connectivity(tmp_path, sckan):
+    path = 'ilxtr:neuron-type-test-1'
+    sckan.knowledge = {entity: {'id': entity, 'label': entity.lower()}
+                            for entity in ['UBERON:0001', 'UBERON:0002', 'UBERON:0004']}
+    sckan.knowledge[path] = {'id': path, 'label': 'test path',
+                             'connectivity': [[['UBERON:0001', []], ['UBERON:0002', []]]]}
+    store = KnowledgeStore(store_directory=tmp_path, verbose=False, concurrent=True, knowledge_ttl=0)
+    assert store.entity_knowledge(path)['label'] == 'test path'
+    assert store.paths_through('UBERON:0002') == [path]
+    sckan.knowledge[path]['connectivity'] = [[['UBERON:0001', []], ['UBERON:0004', []]]]
+    for _ in range(100):
+        store.entity_knowledge(path)        # Stale when cached, so queued for refresh
+        if store.paths_through('UBERON:0004') == [path]:
+            break
+        time.sleep(0.05)
+    assert store.paths_through('UBERON:0004') == [path]
+    assert store.paths_through('UBERON:0002') == []
+    assert 'UBERON:0004' in sckan.lookups
+    assert store.db.execute('select label from knowledge where entity=?', ('UBERON:0004', )).fetchone()[0] == 'uberon:0004'
+    store.close()
+
+def test_generation_invalidates_cache(tmp_path):
+    reader = KnowledgeStore(store_directory=tmp_path, use_sckan=False, generation_check_interval=0, verbose=False)
+    writer = KnowledgeStore(store_directory=tmp_path, use_sckan=False, verbose=False)
+    add_knowledge(writer, 'UBERON:0001', {'id': 'UBERON:0001', 'label': 'heart'})
+    assert reader.entity_knowledge('UBERON:0001', SOURCE)['label'] == 'heart'
+    assert writer.generation == reader.generation
+    add_knowledge(writer, 'UBERON:0001', {'id': 'UBERON:0001', 'label': 'hearts'})
+    assert reader.entity_knowledge('UBERON:0001', SOURCE)['label'] == 'hearts'
+    assert writer.generation == reader.generation
+    reader.close()
+    writer.close()
+
+def test_read_only_store_sees_writes(tmp_path):
+    writer = KnowledgeStore(store_directory=tmp_path, use_sckan=False, verbose=False, concurrent=True)
+    add_knowledge(writer, 'UBERON:0001', {'id': 'UBERON:0001', 'label': 'heart'})
+    reader = KnowledgeStore(store_directory=tmp_path, read_only=True, generation_check_interval=60, verbose=False)
+    assert reader.entity_knowledge('UBERON:0001')['label'] == 'heart'
+    add_knowledge(writer, 'UBERON:0001', {'id': 'UBERON:0001', 'label': 'hearts'})
+    # The generation was checked too recently to be checked again
+    assert not reader.generation_check_due
+    assert reader.entity_knowledge('UBERON:0001')['label'] == 'heart'
+    reader.check_generation()
+    assert reader.entity_knowledge('UBERON:0001')['label'] == 'hearts'
+    reader.close()
+    writer.close()
@@ -24,7 +24,7 @@ import os
 
 #===============================================================================
 
-from mapknowledge import KnowledgeStore
+from mapknowledge import KnowledgeStore, decode_knowledge
 from mapknowledge.competency import CompetencyDatabase, KnowledgeList, KnowledgeSource
 
 #===============================================================================
@@ -70,9 +70,12 @@ def store_knowledge(args) -> KnowledgeList:
     if store.source is None:
         raise ValueError(f'No valid knowledge sources in {args.store_directory}/{args.knowledge_store}')
     knowledge = KnowledgeList(KnowledgeSource(source_id=store.source, sckan_id=store.source))
-    for row in store.db.execute('select entity, knowledge from knowledge where source=?', (store.source,)).fetchall():
-        entity_knowledge = json.loads(row[1])
+    for row in store.db.execute('''select k.entity, b.knowledge from knowledge as k
+                                        join knowledge_blobs as b on b.hash=k.hash where k.source=?''',
+                                (store.source,)).fetchall():
+        entity_knowledge = decode_knowledge(row[1])
         entity_knowledge['id'] = row[0]
+        entity_knowledge['source'] = store.source
         knowledge.knowledge.append(entity_knowledge)
     store.close()
     return knowledge
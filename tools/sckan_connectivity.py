@@ -28,27 +28,26 @@ from tqdm import tqdm
 
 #===============================================================================
 
-from mapknowledge import KnowledgeStore
+from mapknowledge import KnowledgeStore, decode_knowledge
 
 #===============================================================================
 
-def get_prior_knowledge(store: KnowledgeStore, knowledge_source: Optional[str]) -> list[tuple[str, str]]:
-#========================================================================================================
+def get_prior_knowledge(store: KnowledgeStore, knowledge_source: Optional[str]) -> list[tuple[str, dict]]:
+#=========================================================================================================
     if store.db is not None and knowledge_source is not None:
         sources = store.knowledge_sources()     # Ordered, most recent first
         if len(sources) and knowledge_source not in sources:
-            # We have no knowledge of the new source so first copy all knowledge from
-            # the previous source, updating the source column for the new source
-            prior_knowledge = store.db.execute('select entity, knowledge from knowledge where source=?',
-                                (sources[0], )).fetchall()
-            store.db.executemany('insert into knowledge (source, entity, knowledge) values (?, ?, ?)',
-                                ((knowledge_source, row[0], row[1]) for row in prior_knowledge))
-            store.db.commit()
+            # We have no knowledge of the new source so have it overlay the previous
+            # source, inheriting its knowledge rather than copying it. Connectivity
+            # knowledge isn't inherited
+            store.create_overlay_source(knowledge_source, sources[0])
         # Now remove all connectivity knowledge
         store.clean_connectivity(knowledge_source)
         # Get all non-connectivity knowledge
-        prior_knowledge = store.db.execute('select entity, knowledge from knowledge where source=?',
-                                            (knowledge_source, )).fetchall()
+        prior_knowledge = [(row[0], decode_knowledge(row[1]))
+                            for row in store.db.execute('''select k.entity, b.knowledge from knowledge as k
+                                                    join knowledge_blobs as b on b.hash=k.hash where k.source=?''',
+                                                    (knowledge_source, )).fetchall()]
         # Delete everything to do with the new knowledge source
         store.db.execute('delete from knowledge where source=?', (knowledge_source,))
         store.db.commit()
@@ -56,11 +55,10 @@ def get_prior_knowledge(store: KnowledgeStore, knowledge_source: Optional[str])
         return prior_knowledge
     return []
 
-def save_prior_knowledge(store: KnowledgeStore, knowledge_source: Optional[str], prior_knowledge: list[tuple[str, str]]):
-#========================================================================================================================
+def save_prior_knowledge(store: KnowledgeStore, knowledge_source: Optional[str], prior_knowledge: list[tuple[str, dict]]):
+#=========================================================================================================================
     if store.db is not None and knowledge_source is not None:
-        store.db.executemany('replace into knowledge (source, entity, knowledge) values (?, ?, ?)',
-                            ((knowledge_source, row[0], row[1]) for row in prior_knowledge))
+        store.save_knowledge_many(prior_knowledge, source=knowledge_source)
         store.db.commit()
 
 #===============================================================================
@@ -138,10 +136,11 @@ def extract(args):
         'source': knowledge_source,
         'knowledge': []
     }
-    for row in store.db.execute('select entity, knowledge from knowledge where source=?', (knowledge_source,)).fetchall():
-        knowledge = json.loads(row[1])
-        knowledge['id'] = row[0]
-        saved_knowledge['knowledge'].append(knowledge)
+    # Include any knowledge inherited from a parent source, but not knowledge
+    # that has no source
+    for knowledge in store.iter_stored_knowledge(knowledge_source):
+        if knowledge['source'] is not None:
+            saved_knowledge['knowledge'].append(knowledge)
     store.close()
 
     json_file = Path(args.store_directory) / f'{knowledge_source}.json'
@@ -174,18 +173,7 @@ def restore(args):
         prior_knowledge = get_prior_knowledge(store, knowledge_source)
 
     for knowledge in saved_knowledge['knowledge']:
-        entity = knowledge['id']
-        store.db.execute('replace into knowledge (source, entity, knowledge) values (?, ?, ?)',
-                                             (knowledge_source, entity, json.dumps(knowledge)))
-        if 'connectivity' in knowledge:
-            seen_nodes = set()
-            for edge in knowledge['connectivity']:
-                for node in edge:
-                    node = (node[0], tuple(node[1]))
-                    if node not in seen_nodes:
-                        seen_nodes.add(node)
-                        store.db.execute('insert into connectivity_nodes (source, node, path) values (?, ?, ?)',
-                                                                    (knowledge_source, json.dumps(node), entity))
+        store.save_knowledge(knowledge['id'], knowledge, source=knowledge_source)
     store.db.commit()
 
     save_prior_knowledge(store, knowledge_source, prior_knowledge)
@@ -207,6 +195,46 @@ def info(args):
 
 #===============================================================================
 
+def diff(args):
+    store = KnowledgeStore(
+        store_directory=args.store_directory,
+        knowledge_base=args.knowledge_store,
+        read_only=True,
+        use_sckan=False)
+    sources = store.knowledge_sources()     # Ordered, most recent first
+    for source in (args.old_source, args.new_source):
+        if source not in sources:
+            raise ValueError(f'Unknown knowledge source `{source}` in {args.store_directory}/{args.knowledge_store}')
+    changes = 0
+    for (entity, change) in store.diff_sources(args.old_source, args.new_source):
+        print(f'{change}\t{entity}')
+        changes += 1
+    store.close()
+    logging.info(f'{changes} entities differ between `{args.old_source}` and `{args.new_source}`')
+
+#===============================================================================
+
+def split(args):
+    store = KnowledgeStore(
+        store_directory=args.store_directory,
+        knowledge_base=args.knowledge_store,
+        read_only=True,
+        use_sckan=False)
+    sources = store.knowledge_sources()
+    if args.source is not None:
+        if args.source not in sources:
+            raise ValueError(f'Unknown knowledge source `{args.source}` in {args.store_directory}/{args.knowledge_store}')
+        sources = [args.source]
+    output_directory = Path(args.output_directory)
+    output_directory.mkdir(parents=True, exist_ok=True)
+    for source in sources:
+        knowledge_base = output_directory / f'{source}.db'
+        store.export_source(source, knowledge_base)
+        logging.info(f'Saved knowledge for `{source}` to `{knowledge_base}`')
+    store.close()
+
+#===============================================================================
+
 def upgrade(args):
     store = KnowledgeStore(
         store_directory=args.store_directory,
@@ -247,6 +275,16 @@ def main():
     parser_restore.add_argument('json_file', metavar='JSON_FILE', help='File to load knowledge from.')
     parser_restore.set_defaults(func=restore)
 
+    parser_diff = subparsers.add_parser('diff', help='List entities added, removed, or changed between two knowledge sources.')
+    parser_diff.add_argument('old_source', metavar='OLD_SOURCE', help='The earlier knowledge source.')
+    parser_diff.add_argument('new_source', metavar='NEW_SOURCE', help='The later knowledge source.')
+    parser_diff.set_defaults(func=diff)
+
+    parser_split = subparsers.add_parser('split', help='Save each knowledge source as its own knowledge store, for use as a federated store.')
+    parser_split.add_argument('--source', help='Knowledge source to save; defaults to all sources in the store.')
+    parser_split.add_argument('output_directory', metavar='OUTPUT_DIRECTORY', help='Directory to save the knowledge stores in.')
+    parser_split.set_defaults(func=split)
+
     parser_upgrade = subparsers.add_parser('upgrade', help='Upgrade local knowledge store to latest database schema.')
     parser_upgrade.set_defaults(func=upgrade)
 